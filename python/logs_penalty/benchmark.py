@@ -0,0 +1,53 @@
+# Times the server uptime and store hours entry points on random logs. the entry
+# points built on penalty_core.best_times run once with the pure python path and
+# once with numpy (when installed), the streaming parsers are pure python.
+#   python benchmark.py [max_hours]
+
+import random
+import sys
+import time
+
+try:
+    from . import penalty_core, server_time_variant, store_hours_variant
+except ImportError:
+    # run as a script from inside logs_penalty/
+    import penalty_core
+    import server_time_variant
+    import store_hours_variant
+
+ENTRY_POINTS = [
+    ("find_best_removal_time_linear", server_time_variant.find_best_removal_time_linear, "01", True),
+    ("iter_best_removal_times", lambda log: list(server_time_variant.iter_best_removal_times([f"BEGIN {log} END"])), "01", False),
+    ("best_closing_times", store_hours_variant.best_closing_times, "YN", True),
+    ("part3", lambda log: store_hours_variant.part3(f"BEGIN {log} END"), "YN", False),
+]
+
+def _time(func, log, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(log)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run(max_hours=10**6):
+    rng = random.Random(0)
+    sizes = [10**exp for exp in range(3, 10) if 10**exp <= max_hours]
+    numpy_min_bytes = penalty_core.NUMPY_MIN_BYTES
+    try:
+        for size in sizes:
+            for name, func, symbols, uses_numpy in ENTRY_POINTS:
+                log = " ".join(rng.choice(symbols) for _ in range(size))
+                penalty_core.NUMPY_MIN_BYTES = float('inf')
+                python_time = _time(func, log)
+                line = f"{name:<30} {size:>10} hours  python {python_time:.4f}s"
+                if uses_numpy and penalty_core.np is not None:
+                    penalty_core.NUMPY_MIN_BYTES = 0
+                    line += f"  numpy {_time(func, log):.4f}s"
+                print(line)
+    finally:
+        penalty_core.NUMPY_MIN_BYTES = numpy_min_bytes
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10**6)
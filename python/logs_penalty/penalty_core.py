@@ -0,0 +1,265 @@
+#  * Penalty engine shared by server_time_variant.py and store_hours_variant.py.
+#  * Both problems are the same once the symbols are mapped to a delta:
+#  *   +1 for an hour that is penalised while the server/store is still on/open ('1' / 'N')
+#  *   -1 for an hour that is penalised after removal/closing ('0' / 'Y')
+#  * The penalty of cutting at hour 0 is the number of -1 hours, and moving the cut one
+#  * hour later adds that hour's delta, so every penalty is a prefix sum of the deltas.
+
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SERVER_SYMBOLS = {'1': 1, '0': -1}
+STORE_SYMBOLS = {'N': 1, 'Y': -1}
+
+# below this many bytes the numpy setup costs more than the python loop
+NUMPY_MIN_BYTES = 1 << 12
+
+_lookup_tables = {}
+
+def _lookup_table(symbols):
+    # byte -> delta table for single character symbols, plus a whitespace mask
+    key = tuple(sorted(symbols.items()))
+    if key not in _lookup_tables:
+        deltas = np.zeros(256, dtype=np.int64)
+        for symbol, delta in symbols.items():
+            deltas[ord(symbol)] = delta
+        whitespace = np.zeros(256, dtype=bool)
+        whitespace[list(b" \t\n\r\x0b\x0c")] = True
+        _lookup_tables[key] = deltas, whitespace
+    return _lookup_tables[key]
+
+def _numpy_deltas(log, symbols):
+    # deltas of every hour, or None when the log can't be read byte by byte
+    # (non ascii text, multi character tokens)
+    if not log.isascii() or any(len(symbol) != 1 for symbol in symbols):
+        return None
+    deltas, whitespace = _lookup_table(symbols)
+    data = np.frombuffer(log.encode('ascii'), dtype=np.uint8)
+    token_bytes = ~whitespace[data]
+    token_starts = token_bytes.copy()
+    token_starts[1:] &= ~token_bytes[:-1]
+    if token_starts.sum() != token_bytes.sum():
+        return None
+    return deltas[data[token_bytes]]
+
+def _python_curve(log, symbols):
+    hours = log.split()
+    penalty = sum(1 for hour in hours if symbols.get(hour) == -1)
+    curve = [penalty]
+    for hour in hours:
+        penalty += symbols.get(hour, 0)
+        curve.append(penalty)
+    return curve
+
+def _curve(log, symbols, use_numpy):
+    # the penalty curve as a list or a numpy array, whichever path ran
+    if use_numpy is None:
+        use_numpy = np is not None and len(log) >= NUMPY_MIN_BYTES
+    if use_numpy:
+        if np is None:
+            raise ImportError("use_numpy=True requires numpy")
+        deltas = _numpy_deltas(log, symbols)
+        if deltas is not None:
+            curve = np.empty(len(deltas) + 1, dtype=np.int64)
+            curve[0] = (deltas == -1).sum()
+            np.cumsum(deltas, out=curve[1:])
+            curve[1:] += curve[0]
+            return curve
+    return _python_curve(log, symbols)
+
+def penalty_curve(log, symbols, use_numpy=None):
+    # penalty of cutting the log at every hour 0..n.
+    # use_numpy=None picks numpy for long logs when it is installed
+    curve = _curve(log, symbols, use_numpy)
+    return curve if isinstance(curve, list) else curve.tolist()
+
+def best_times(log, symbols, use_numpy=None):
+    # (earliest best hour, every hour tied for the minimum, penalty_curve)
+    curve = _curve(log, symbols, use_numpy)
+    if isinstance(curve, list):
+        min_penalty = min(curve)
+        best_hours = [hour for hour, penalty in enumerate(curve) if penalty == min_penalty]
+    else:
+        best_hours = np.flatnonzero(curve == curve.min()).tolist()
+        curve = curve.tolist()
+    return best_hours[0], best_hours, curve
+
+
+# summaries of a stretch of log: (hours, prefix, best_prefix, best_hour), where
+# prefix is the sum of its deltas and best_prefix the lowest running sum, first
+# reached after best_hour hours (0 and 0 if it never drops below zero).
+# summaries of back to back stretches join into the summary of the whole, which
+# is what lets the byte and shard based scans skip over the hours
+EMPTY_SUMMARY = (0, 0, 0, 0)
+
+def join_summaries(summaries):
+    # summary of the stretches back to back, in order
+    hours = prefix = best_prefix = best_hour = 0
+    for seg_hours, seg_prefix, seg_best_prefix, seg_best_hour in summaries:
+        if prefix + seg_best_prefix < best_prefix:
+            best_prefix = prefix + seg_best_prefix
+            best_hour = hours + seg_best_hour
+        hours += seg_hours
+        prefix += seg_prefix
+    return hours, prefix, best_prefix, best_hour
+
+def _hour_summary(delta):
+    return 1, delta, min(delta, 0), 1 if delta < 0 else 0
+
+def _bit_summaries(byte, hours=8):
+    # one hour per bit, lowest bit first, set = +1
+    return (_hour_summary(1 if byte >> hour & 1 else -1) for hour in range(hours))
+
+_BYTE_SUMMARIES = [join_summaries(_bit_summaries(byte)) for byte in range(256)]
+
+def summarize_bits(bits, hours):
+    # summary of a log packed into an int, bit i set = +1 during hour i+1,
+    # looked up a byte (8 hours) at a time
+    full_bytes, rest = divmod(hours, 8)
+    data = bits.to_bytes(full_bytes + 1, 'little')
+    summaries = [_BYTE_SUMMARIES[byte] for byte in data[:full_bytes]]
+    summaries.extend(_bit_summaries(data[full_bytes], rest))
+    return join_summaries(summaries)
+
+
+class PenaltyTracker:
+    # best cut hour of a log that grows one hour at a time, O(1) per hour.
+    # only the lowest prefix seen so far and where it happened are kept
+
+    def __init__(self, symbols) -> None:
+        self.symbols = symbols
+        self.hours = 0
+        self.cut_at_zero = 0 # penalty of cutting before the first hour
+        self.prefix = 0
+        self.best_prefix = 0
+        self.best_hour = 0
+
+    def push(self, symbol):
+        delta = self.symbols.get(symbol)
+        if delta is None:
+            raise ValueError(f"invalid sample {symbol!r}")
+        self.push_deltas((delta,))
+
+    def push_deltas(self, deltas):
+        # the next hours, already mapped to +1/-1 (or 0 for hours that don't count)
+        hours, cut_at_zero, prefix, best_prefix, best_hour = self.hours, self.cut_at_zero, self.prefix, self.best_prefix, self.best_hour
+        for delta in deltas:
+            hours += 1
+            if delta < 0:
+                cut_at_zero += 1
+            prefix += delta
+            if prefix < best_prefix:
+                best_prefix = prefix
+                best_hour = hours
+        self.hours, self.cut_at_zero, self.prefix, self.best_prefix, self.best_hour = hours, cut_at_zero, prefix, best_prefix, best_hour
+
+    @property
+    def min_penalty(self):
+        return self.cut_at_zero + self.best_prefix
+
+    @property
+    def summary(self):
+        return self.hours, self.prefix, self.best_prefix, self.best_hour
+
+
+class SequenceParser:
+    # push parser for aggregate logs: text chunks cut at any point go in, the
+    # best cut hour of every valid BEGIN ... END sequence comes out as soon as
+    # its END is read. unknown tokens count as hours without a penalty either
+    # way, same as the original string based solutions
+
+    def __init__(self, symbols) -> None:
+        self.symbols = symbols
+        self.carry = ''
+        self.last_action = 'END'
+        self.tracker = PenaltyTracker(symbols) # state of the open sequence
+
+    def _push_tokens(self, tokens, res):
+        # the PenaltyTracker walk, inlined: this is the hot loop of every
+        # streaming path, so the tracker is only read before and written after.
+        # the parser never needs cut_at_zero, so it isn't kept up to date here
+        symbols = self.symbols
+        tracker = self.tracker
+        last_action = self.last_action
+        hours, prefix, best_prefix, best_hour = tracker.hours, tracker.prefix, tracker.best_prefix, tracker.best_hour
+        for token in tokens:
+            if token == 'END' or token == 'BEGIN':
+                if last_action == 'BEGIN' and token == 'END' and hours > 0:
+                    res.append(best_hour)
+                last_action = token
+                hours = prefix = best_prefix = best_hour = 0
+            else:
+                hours += 1
+                prefix += symbols.get(token, 0)
+                if prefix < best_prefix:
+                    best_prefix = prefix
+                    best_hour = hours
+        self.last_action = last_action
+        tracker.hours, tracker.prefix, tracker.best_prefix, tracker.best_hour = hours, prefix, best_prefix, best_hour
+
+    def feed(self, chunk):
+        # returns the best hours of the sequences that ended in this chunk
+        res = []
+        text = self.carry + chunk
+        tokens = text.split()
+        self.carry = ''
+        if tokens and not text[-1].isspace():
+            # might be cut in half, wait for the next chunk
+            self.carry = tokens.pop()
+        self._push_tokens(tokens, res)
+        return res
+
+    def close(self):
+        res = []
+        if self.carry:
+            self._push_tokens([self.carry], res)
+            self.carry = ''
+        return res
+
+
+def test():
+    assert penalty_curve("0 0 1 0", SERVER_SYMBOLS) == [3, 2, 1, 2, 1]
+    assert penalty_curve("Y N Y Y N", STORE_SYMBOLS) == [3, 2, 3, 2, 1, 2]
+    assert best_times("Y Y N Y N N N N", STORE_SYMBOLS) == (2, [2, 4], [3, 2, 1, 2, 1, 2, 3, 4, 5])
+    assert best_times("", SERVER_SYMBOLS) == (0, [0], [0])
+
+    tracker = PenaltyTracker(STORE_SYMBOLS)
+    for symbol in "YNYYN":
+        tracker.push(symbol)
+    assert (tracker.best_hour, tracker.min_penalty) == (4, 1)
+
+    parser = SequenceParser(SERVER_SYMBOLS)
+    assert parser.feed("BEGIN 0 0 1 1 E") == []
+    assert parser.feed("ND BEGIN 1") == [2]
+    assert parser.feed(" 1 0") == []
+    assert parser.close() == []
+    assert parser.feed(" END") == [] and parser.close() == [0]
+
+    assert join_summaries([]) == EMPTY_SUMMARY
+    halves = [join_summaries(map(_hour_summary, deltas)) for deltas in ([1, -1, -1], [1, 1, -1, -1, -1])]
+    assert join_summaries(halves) == join_summaries(map(_hour_summary, [1, -1, -1, 1, 1, -1, -1, -1])) == (8, -2, -2, 8)
+    rng = random.Random(1)
+    for hours in [0, 1, 7, 8, 9, 64, 100]:
+        bits = rng.getrandbits(hours) if hours else 0
+        deltas = [1 if bits >> hour & 1 else -1 for hour in range(hours)]
+        tracker = PenaltyTracker(SERVER_SYMBOLS)
+        tracker.push_deltas(deltas)
+        assert summarize_bits(bits, hours) == tracker.summary == join_summaries(map(_hour_summary, deltas))
+
+    if np is not None:
+        for log in ["0 0 1 0", "1\n0  0 1", "", "   ", "0 0 10 1", "0 x 1"]:
+            for symbols in [SERVER_SYMBOLS, STORE_SYMBOLS]:
+                assert penalty_curve(log, symbols, use_numpy=True) == penalty_curve(log, symbols, use_numpy=False)
+                assert best_times(log, symbols, use_numpy=True) == best_times(log, symbols, use_numpy=False)
+
+        rng = random.Random(0)
+        log = " ".join(rng.choice("01") for _ in range(NUMPY_MIN_BYTES))
+        assert best_times(log, SERVER_SYMBOLS) == best_times(log, SERVER_SYMBOLS, use_numpy=False)
+
+
+if __name__ == "__main__":
+    test()
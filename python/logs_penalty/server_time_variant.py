@@ -73,8 +73,31 @@
 #  * Example
 #  *   get_best_removal_times("BEGIN BEGIN \nBEGIN 1 1 BEGIN 0 0\n END 1 1 BEGIN") should return an array: [2]
 
+import concurrent.futures
+import io
+import mmap
+import os
+import random
+import re
+import tempfile
+
+try:
+    from . import penalty_core
+    from .penalty_core import SERVER_SYMBOLS, PenaltyTracker, SequenceParser
+except ImportError:
+    # run as a script from inside logs_penalty/
+    import penalty_core
+    from penalty_core import SERVER_SYMBOLS, PenaltyTracker, SequenceParser
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 def compute_penalty(log, remove_at):
     #computes the total penalty
+    if isinstance(log, BitLog):
+        return log.penalty(remove_at)
     log  = log.split(" ")
     penalty = 0
     
@@ -87,6 +110,8 @@ def compute_penalty(log, remove_at):
     return penalty
 
 def find_best_removal_time(log):
+    if isinstance(log, BitLog):
+        return log.best_removal_time()
     min_penalty = float('inf')
     best_hour = None
     for i in range(len(log)+1):
@@ -98,6 +123,9 @@ def find_best_removal_time(log):
 
 def find_best_multiple(log: str):
     # For example, the sequence "BEGIN BEGIN BEGIN 1 1 BEGIN 0 0 END 1 1 BEGIN" has only one valid sequence "BEGIN 0 0 END".
+    if not isinstance(log, str):
+        # already split into BitLogs, see BitLog.from_aggregate
+        return [find_best_removal_time(bit_log) for bit_log in log]
     log = log.replace('\n', '')
     log = log.split(" ")
     last_action = 'END'
@@ -118,8 +146,274 @@ def find_best_multiple(log: str):
     return res
 
 
-        
+def penalty_curve(log):
+    # penalty for every remove_at in 0..n in a single pass, see penalty_core
+    return penalty_core.penalty_curve(log, SERVER_SYMBOLS)
+
+def find_best_removal_time_linear(log):
+    # O(n) version of find_best_removal_time, returns (best_hour, penalty_curve)
+    # ties go to the earliest hour, same as find_best_removal_time
+    best_hour, _, curve = penalty_core.best_times(log, SERVER_SYMBOLS)
+    return best_hour, curve
+
+def _iter_chunks(source, chunk_size=1 << 16):
+    # file objects are read in fixed size chunks, anything else is assumed
+    # to already be an iterable of text chunks
+    if not hasattr(source, 'read'):
+        yield from source
+        return
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def iter_best_removal_times(source):
+    # streaming find_best_multiple over a file object or an iterable of chunks.
+    # yields the best removal hour of each valid sequence as soon as its END is
+    # read; only the running prefix penalty of the open sequence is kept around
+    parser = SequenceParser(SERVER_SYMBOLS)
+    for chunk in _iter_chunks(source):
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+_MARKER_RE = re.compile(rb'BEGIN|END')
+
+# every byte that isn't a b'0' or b'1' hour
+_NOT_DIGITS = bytes(byte for byte in range(256) if byte not in b'01')
+
+# bytes of log scanned per step, so memory stays the same however long a sequence is
+_SCAN_WINDOW = 1 << 16
+
+def _scan_digits(buf, start, end):
+    # counts b'1' as +1 and b'0' as -1 over buf[start:end], everything else is skipped.
+    # returns the penalty_core summary of that stretch of log. each window's
+    # hours are packed into an int the same way BitLog does it, so the walk goes
+    # a byte (8 hours) at a time instead of visiting every separator
+    summary = penalty_core.EMPTY_SUMMARY
+    for window_start in range(start, end, _SCAN_WINDOW):
+        window = bytes(buf[window_start:min(window_start + _SCAN_WINDOW, end)])
+        digits = window.translate(None, _NOT_DIGITS)
+        if digits:
+            window_summary = penalty_core.summarize_bits(int(digits[::-1], 2), len(digits))
+            summary = penalty_core.join_summaries((summary, window_summary))
+    return summary
+
+def find_best_multiple_mmap(path):
+    # find_best_multiple over an aggregate log file, without decoding it.
+    # the file is mmapped, BEGIN/END markers are located with a bytes regex and
+    # only the hours between a BEGIN and the END right after it are scanned
+    res = []
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return res
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            last_action = b'END'
+            seg_start = 0
+            for match in _MARKER_RE.finditer(mm):
+                item = match.group()
+                if last_action == b'BEGIN' and item == b'END':
+                    hours, _, _, best_hour = _scan_digits(view, seg_start, match.start())
+                    if hours > 0:
+                        res.append(best_hour)
+                last_action = item
+                seg_start = match.end()
+    return res
+
+_WHITESPACE_RE = re.compile(rb'\s')
+
+def _shard_bounds(mm, shards):
+    # splits the file into byte ranges, moving every cut forward to the next
+    # whitespace so that no BEGIN/END/digit token is split between two shards
+    size = len(mm)
+    bounds = [0]
+    for i in range(1, shards):
+        cut = max(size * i // shards, bounds[-1])
+        match = _WHITESPACE_RE.search(mm, cut)
+        bounds.append(match.start() if match else size)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+def _scan_shard(path, start, end):
+    # reduces one shard to a list alternating digit summaries and markers.
+    # the spans before the first and after the last marker may belong to a
+    # sequence that straddles the seam, so those are always summarised
+    events = []
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            last_action = None
+            seg_start = start
+            for match in _MARKER_RE.finditer(mm, start, end):
+                item = match.group()
+                if last_action is None or (last_action == b'BEGIN' and item == b'END'):
+                    events.append(_scan_digits(view, seg_start, match.start()))
+                else:
+                    events.append(penalty_core.EMPTY_SUMMARY)
+                events.append(item)
+                last_action = item
+                seg_start = match.end()
+            events.append(_scan_digits(view, seg_start, end))
+    return events
+
+def find_best_multiple_parallel(path, workers=None, shards=None):
+    # find_best_multiple_mmap spread over a process pool.
+    # each shard is reduced to digit summaries and markers, and the BEGIN/END
+    # state machine is then replayed in file order, joining the summaries that
+    # meet at a seam. results come back in the same order as find_best_multiple
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers * 4
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bounds = _shard_bounds(mm, shards)
+
+    res = []
+    last_action = b'END'
+    segment = penalty_core.EMPTY_SUMMARY
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        starts, ends = zip(*bounds)
+        for events in pool.map(_scan_shard, [path] * len(bounds), starts, ends):
+            for event in events:
+                if isinstance(event, tuple):
+                    segment = penalty_core.join_summaries((segment, event))
+                    continue
+                if last_action == b'BEGIN' and event == b'END' and segment[0] > 0:
+                    res.append(segment[3])
+                last_action = event
+                segment = penalty_core.EMPTY_SUMMARY
+    return res
+
+def find_best_removal_times_batch(logs):
+    # best removal hour for many logs at once, using numpy instead of a python
+    # loop per hour. the logs are joined into one byte array and the hours are
+    # picked out of it with byte masks, leaving one delta per hour; equal
+    # length logs are viewed as a 2d array, ragged ones are handled through
+    # their start offsets into the flat array. returns an int64 array
+    if np is None:
+        raise ImportError("find_best_removal_times_batch requires numpy")
+
+    try:
+        encoded = [log.encode('ascii') for log in logs]
+    except UnicodeEncodeError:
+        raise ValueError("invalid sample, hours must be '0' or '1'") from None
+    # one space between logs so the last hour of one and the first of the next
+    # can't read as a single two byte token
+    data = np.frombuffer(b" ".join(encoded), dtype=np.uint8)
+    byte_lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    byte_ends = np.cumsum(byte_lengths + 1) - 1
+    # uint8 arithmetic wraps, so one compare each picks out '0'/'1' and \t..\r
+    digits = (data - ord('0')) < 2
+    bad = ~(digits | (data == ord(' ')) | ((data - ord('\t')) < 5))
+    # a digit right after another one is a multi character token
+    bad[1:] |= digits[1:] & digits[:-1]
+    if bad.any():
+        log = int(np.searchsorted(byte_ends, np.flatnonzero(bad)[0]))
+        raise ValueError(f"invalid sample in log {log}, hours must be '0' or '1'")
+
+    positions = np.flatnonzero(digits)
+    lengths = np.diff(np.searchsorted(positions, byte_ends), prepend=0)
+    best = np.zeros(len(encoded), dtype=np.int64)
+    if not lengths.any():
+        return best
+    # running sum of +1 per down hour and -1 per up hour, the penalty curve of
+    # each log is its up hour count plus this prefix
+    deltas = (data[positions].view(np.int8) - ord('0')) * 2 - 1
+
+    if (lengths == lengths[0]).all():
+        prefix = np.cumsum(deltas.reshape(len(encoded), lengths[0]), axis=1, dtype=np.int64)
+        first_min = prefix.argmin(axis=1)
+        mins = prefix[np.arange(len(encoded)), first_min]
+        best[:] = first_min + 1
+    else:
+        nonempty = lengths > 0
+        starts = (np.cumsum(lengths) - lengths)[nonempty]
+        seg_lengths = lengths[nonempty]
+        prefix = np.cumsum(deltas, dtype=np.int64)
+        base = np.where(starts > 0, prefix[starts - 1], 0)
+        prefix -= np.repeat(base, seg_lengths)
+        seg_mins = np.minimum.reduceat(prefix, starts)
+        # first hour of each log that hits its minimum
+        hits = np.flatnonzero(prefix == np.repeat(seg_mins, seg_lengths))
+        first_hit = hits[np.searchsorted(hits, starts)]
+        best[nonempty] = first_hit - starts + 1
+        mins = np.zeros(len(encoded), dtype=np.int64)
+        mins[nonempty] = seg_mins
+    # removing before the first hour wins any tie
+    best[mins >= 0] = 0
+    return best
+
+class RemovalTracker(PenaltyTracker):
+    # keeps the best remove_at of a live server up to date, one hourly sample
+    # at a time, in O(1) per sample. samples are 0/1 or '0'/'1'
+
+    def __init__(self) -> None:
+        super().__init__({**SERVER_SYMBOLS, 1: 1, 0: -1})
 
+    @property
+    def up_hours(self):
+        return self.cut_at_zero
+
+    @property
+    def best_remove_at(self):
+        return self.best_hour
+
+class BitLog:
+    # a server log packed into the bits of an int, bit i set = down during hour i+1.
+    # about 1 bit per hour instead of a string token per hour, and penalties
+    # are answered with popcounts instead of walking the hours
+
+    __slots__ = ('bits', 'hours', 'down_hours')
+
+    def __init__(self, bits=0, hours=0) -> None:
+        if bits >> hours:
+            raise ValueError("bits set past the last hour")
+        self.bits = bits
+        self.hours = hours
+        self.down_hours = bits.bit_count()
+
+    @classmethod
+    def from_text(cls, log):
+        hours = log.split()
+        if not hours:
+            return cls()
+        digits = "".join(hours)
+        # int() alone would take "01" as two hours, or "0_1"
+        if len(digits) != len(hours) or digits.strip("01"):
+            raise ValueError("invalid sample, hours must be '0' or '1'")
+        # int(..., 2) reads the most significant bit first, so reverse to put hour 1 at bit 0
+        return cls(int("".join(reversed(hours)), 2), len(hours))
+
+    @classmethod
+    def from_aggregate(cls, log):
+        # one BitLog per valid BEGIN ... END sequence, same rules as find_best_multiple
+        res = []
+        last_action = 'END'
+        cur_log = []
+        for item in log.split():
+            if item == 'END' or item == 'BEGIN':
+                if last_action == 'BEGIN' and item == 'END' and cur_log:
+                    res.append(cls.from_text(" ".join(cur_log)))
+                last_action = item
+                cur_log = []
+            else:
+                cur_log.append(item)
+        return res
+
+    def to_text(self):
+        return " ".join(reversed(format(self.bits, f'0{self.hours}b'))) if self.hours else ""
+
+    def __len__(self):
+        return self.hours
+
+    def penalty(self, remove_at):
+        remove_at = max(0, min(remove_at, self.hours))
+        down_before = (self.bits & ((1 << remove_at) - 1)).bit_count()
+        up_after = (self.hours - remove_at) - (self.down_hours - down_before)
+        return down_before + up_after
+
+    def best_removal_time(self):
+        return penalty_core.summarize_bits(self.bits, self.hours)[3]
 
 
 def test1():
@@ -148,11 +442,154 @@ def test3():
     assert find_best_multiple("BEGIN BEGIN END 0 0 1 1 0 0 0 0 END END") == []
     assert find_best_multiple("0 1 1 1 0") == []
     assert find_best_multiple("BEGIN BEGIN \nBEGIN 1 1 BEGIN 0 0\n END 1 1 BEGIN") == [2]
-    
 
+def test4():
+    assert penalty_curve("0 0 1 0") == [3, 2, 1, 2, 1]
+    assert penalty_curve("") == [0]
+    assert find_best_removal_time_linear("0 0 1 1") == (2, [2, 1, 0, 1, 2])
 
+    rng = random.Random(0)
+    for _ in range(200):
+        log = " ".join(rng.choice("01") for _ in range(rng.randint(1, 30)))
+        best_hour, curve = find_best_removal_time_linear(log)
+        n = len(log.split(" "))
+        assert curve == [compute_penalty(log, i) for i in range(n + 1)]
+        assert best_hour == find_best_removal_time(log)
 
-    
-test1()
-test2()
-test3()
\ No newline at end of file
+def test5():
+    log = "BEGIN BEGIN \nBEGIN 1 1 BEGIN 0 0\n END 1 1 BEGIN"
+    assert list(iter_best_removal_times(io.StringIO(log))) == [2]
+    assert list(iter_best_removal_times(["BEGIN 0 0 1 1 0 E", "ND BEG", "IN 0 0 1 1 0 0 0 0 END"])) == [2, 8]
+    assert list(iter_best_removal_times(["BEGIN BEGIN END 0 0 1 1 0 0 0 0 END END"])) == []
+    assert list(iter_best_removal_times([])) == []
+
+    rng = random.Random(1)
+    tokens = ["BEGIN", "END", "0", "1", "0", "1", "0", "1"]
+    for _ in range(200):
+        log = " ".join(rng.choice(tokens) for _ in range(rng.randint(0, 40)))
+        expected = find_best_multiple(log)
+        cut = sorted(rng.randint(0, len(log)) for _ in range(3))
+        chunks = [log[i:j] for i, j in zip([0] + cut, cut + [len(log)])]
+        assert list(iter_best_removal_times(chunks)) == expected
+        assert list(iter_best_removal_times(io.StringIO(log))) == expected
+
+def test6():
+    rng = random.Random(2)
+    tokens = ["BEGIN", "END", "0", "1", "0", "1", "0", "1"]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "aggregate.log")
+        for _ in range(100):
+            log = "".join(rng.choice(tokens) + rng.choice([" ", " \n"]) for _ in range(rng.randint(0, 40)))
+            with open(path, 'w') as f:
+                f.write(log)
+            assert find_best_multiple_mmap(path) == find_best_multiple(log)
+
+    # sequences longer than a scan window are folded window by window
+    global _SCAN_WINDOW
+    window = _SCAN_WINDOW
+    try:
+        for _SCAN_WINDOW in [1, 3, 8, 17]:
+            log = " ".join(rng.choice("01") for _ in range(200))
+            assert _scan_digits(log.encode(), 0, len(log)) == penalty_core.summarize_bits(BitLog.from_text(log).bits, 200)
+    finally:
+        _SCAN_WINDOW = window
+
+def test7():
+    assert penalty_core.join_summaries([_scan_digits(b"0 0", 0, 3), _scan_digits(b"1 1", 0, 3)]) == _scan_digits(b"0 0 1 1", 0, 7)
+    assert penalty_core.join_summaries([_scan_digits(b"1 1", 0, 3), _scan_digits(b"0 0", 0, 3)]) == _scan_digits(b"1 1 0 0", 0, 7)
+
+    rng = random.Random(3)
+    tokens = ["BEGIN", "END", "0", "1", "0", "1", "0", "1"]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "aggregate.log")
+        for _ in range(10):
+            log = "".join(rng.choice(tokens) + rng.choice([" ", " \n"]) for _ in range(rng.randint(0, 300)))
+            with open(path, 'w') as f:
+                f.write(log)
+            expected = find_best_multiple(log)
+            for shards in [1, 3, 17, 1000]:
+                assert find_best_multiple_parallel(path, workers=2, shards=shards) == expected
+
+def test8():
+    if np is None:
+        return
+    assert find_best_removal_times_batch([]).tolist() == []
+    assert find_best_removal_times_batch(["0 0 1 1", "1 1 0 0", "0 1 1 1"]).tolist() == [2, 0, 1]
+    assert find_best_removal_times_batch(["0 0 1 1 0 0 0 0", "", "1", "0 1 1 1 0"]).tolist() == [8, 0, 0, 1]
+    for logs, message in [(["10 0 0"], "log 0"), (["1 1", "0 x 1 1"], "log 1"), (["0", "", "1 2"], "log 2"), (["0 é"], "")]:
+        try:
+            find_best_removal_times_batch(logs)
+            assert False
+        except ValueError as e:
+            assert message in str(e)
+
+    rng = random.Random(4)
+    for _ in range(50):
+        same_length = rng.random() < 0.5
+        n = rng.randint(1, 30)
+        logs = [" ".join(rng.choice("01") for _ in range(n if same_length else rng.randint(0, 30)))
+                for _ in range(rng.randint(1, 20))]
+        expected = [find_best_removal_time_linear(log)[0] for log in logs]
+        assert find_best_removal_times_batch(logs).tolist() == expected
+
+def test9():
+    tracker = RemovalTracker()
+    assert (tracker.best_remove_at, tracker.min_penalty) == (0, 0)
+    for sample, expected in zip([1, 0, 0, 1], [(0, 0), (0, 1), (3, 1), (3, 1)]):
+        tracker.push(sample)
+        assert (tracker.best_remove_at, tracker.min_penalty) == expected
+    try:
+        tracker.push('2')
+        assert False
+    except ValueError:
+        pass
+
+    rng = random.Random(5)
+    samples = [rng.choice("01") for _ in range(200)]
+    tracker = RemovalTracker()
+    for hour, sample in enumerate(samples, 1):
+        tracker.push(sample)
+        best_hour, curve = find_best_removal_time_linear(" ".join(samples[:hour]))
+        assert tracker.best_remove_at == best_hour
+        assert tracker.min_penalty == curve[best_hour]
+
+def test10():
+    bit_log = BitLog.from_text("0 0 1 0")
+    assert (bit_log.bits, len(bit_log)) == (0b0100, 4)
+    assert bit_log.to_text() == "0 0 1 0"
+    assert compute_penalty(bit_log, 0) == 3
+    assert compute_penalty(bit_log, 4) == 1
+    assert find_best_removal_time(BitLog.from_text("0 0 1 1")) == 2
+    assert BitLog.from_text("").to_text() == ""
+    assert find_best_removal_time(BitLog()) == 0
+    aggregate = "BEGIN BEGIN \nBEGIN 1 1 BEGIN 0 0\n END 1 1 BEGIN"
+    assert [b.to_text() for b in BitLog.from_aggregate(aggregate)] == ["0 0"]
+    assert find_best_multiple(BitLog.from_aggregate(aggregate)) == [2]
+    for log in ["01 0", "10 1", "0_1", "0 x", "0 2 1", "+1"]:
+        try:
+            BitLog.from_text(log)
+            assert False
+        except ValueError as e:
+            assert "invalid sample" in str(e)
+
+    rng = random.Random(6)
+    for _ in range(200):
+        log = " ".join(rng.choice("01") for _ in range(rng.randint(1, 40)))
+        bit_log = BitLog.from_text(log)
+        assert bit_log.to_text() == log
+        best_hour, curve = find_best_removal_time_linear(log)
+        assert [compute_penalty(bit_log, i) for i in range(len(curve))] == curve
+        assert find_best_removal_time(bit_log) == best_hour
+
+
+if __name__ == "__main__":
+    test1()
+    test2()
+    test3()
+    test4()
+    test5()
+    test6()
+    test7()
+    test8()
+    test9()
+    test10()
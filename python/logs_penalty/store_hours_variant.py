@@ -1,3 +1,14 @@
+import random
+import time
+
+try:
+    from . import penalty_core
+    from .penalty_core import STORE_SYMBOLS, SequenceParser
+except ImportError:
+    # run as a script from inside logs_penalty/
+    import penalty_core
+    from penalty_core import STORE_SYMBOLS, SequenceParser
+
 def part1(store_log, closing_time):
     # Given a String like "Y N Y Y N" where Y denotes if there were any customers at a given hour 
     # and N denotes no customers at a given hour. There is a penalty for a hour where it is open 
@@ -39,7 +50,8 @@ def part2(store_log):
     best_hour = None
     min_penalty = float('inf')
     
-    for possible_closing in range(len(store_log.split(" "))):
+    # closing after the last hour is allowed too
+    for possible_closing in range(len(store_log.split(" ")) + 1):
         penalty = part1(store_log, possible_closing)
         if penalty < min_penalty:
             min_penalty = penalty
@@ -47,35 +59,101 @@ def part2(store_log):
         
     return best_hour
 
-def part3():
+def best_closing_times(store_log):
+    # single pass version of part2, see penalty_core.
+    # returns (best_hour, every hour tied for the minimum, penalty for every closing hour 0..n)
+    return penalty_core.best_times(store_log, STORE_SYMBOLS)
+
+def part3(store_logs):
     # 3rd Part 
 	# Examples get_best_closing_times("BEGIN Y Y END \nBEGIN N N END") should
 	# return an array: [2, 0]
 	# get_best_closing_times("BEGIN BEGIN \nBEGIN N N BEGIN Y Y\n END N N END")
 	# should return an array: [2]
-    return 
+    parser = StoreLogParser()
+    return parser.feed(store_logs) + parser.close()
 
-def part4():
+def part4(stream):
     # 4th part 
 	# Logs are coming in stream one by one in a batch with each stream of data i.e. not passed at once
-    return
-
-
-tests_part_1 = [
-    ["Y Y Y N N N N", 0, 3],
-    ["Y Y Y N N N N", 7, 4],
-    ["", 0, 0],
-    ["Y N Y N N N N", 3, 1]
-]
-
-tests_part_2 = [
-    ["Y Y Y N N N N", 3],
-    ["Y Y N Y N N N N", 2], # 2, 3, 4
-    ["Y Y N Y Y N N N N", 5],
-    ["N N Y N N N N", 0] # 0, 1
-]
-
-for log, answer in tests_part_2:
-    print(part2(log), answer)
-    assert part2(log) == answer
-    print("")
+    # yields the best closing hour of every store log as soon as its END shows up
+    parser = StoreLogParser()
+    for chunk in stream:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+class StoreLogParser(SequenceParser):
+    # push parser for BEGIN/END store logs, chunks can be cut anywhere.
+    # feed(chunk) returns the best closing hours of the logs that ended in it
+
+    def __init__(self) -> None:
+        super().__init__(STORE_SYMBOLS)
+
+def benchmark_part2(sizes=(10**4, 10**5, 10**6, 10**7), quadratic_limit=10**4):
+    # part2 is quadratic, so it only runs up to quadratic_limit hours
+    rng = random.Random(0)
+    for size in sizes:
+        store_log = " ".join(rng.choice("YN") for _ in range(size))
+
+        start = time.perf_counter()
+        best_hour = best_closing_times(store_log)[0]
+        linear = time.perf_counter() - start
+
+        if size > quadratic_limit:
+            print(f"{size:>9} hours  best_closing_times {linear:.3f}s  part2 skipped")
+            continue
+        start = time.perf_counter()
+        assert part2(store_log) == best_hour
+        quadratic = time.perf_counter() - start
+        print(f"{size:>9} hours  best_closing_times {linear:.3f}s  part2 {quadratic:.3f}s")
+
+
+if __name__ == "__main__":
+    tests_part_1 = [
+        ["Y Y Y N N N N", 0, 3],
+        ["Y Y Y N N N N", 7, 4],
+        ["", 0, 0],
+        ["Y N Y N N N N", 3, 1]
+    ]
+
+    tests_part_2 = [
+        ["Y Y Y N N N N", 3],
+        ["Y Y N Y N N N N", 2], # 2, 3, 4
+        ["Y Y N Y Y N N N N", 5],
+        ["N N Y N N N N", 0] # 0, 1
+    ]
+
+    for log, answer in tests_part_2:
+        print(part2(log), answer)
+        assert part2(log) == answer
+        print("")
+
+    tests_best_closing_times = [
+        ["Y Y Y N N N N", (3, [3], [3, 2, 1, 0, 1, 2, 3, 4])],
+        ["Y Y N Y N N N N", (2, [2, 4], [3, 2, 1, 2, 1, 2, 3, 4, 5])],
+        ["N N Y N N N N", (0, [0], [1, 2, 3, 2, 3, 4, 5, 6])],
+        ["Y Y", (2, [2], [2, 1, 0])],
+        ["", (0, [0], [0])],
+    ]
+
+    for log, answer in tests_best_closing_times:
+        assert best_closing_times(log) == answer
+        best_hour, _, penalties = answer
+        assert penalties == [part1(log, hour) for hour in range(len(penalties))]
+        assert part2(log) == best_hour
+
+    # benchmark_part2()
+
+    tests_part_3 = [
+        ["BEGIN Y Y END \nBEGIN N N END", [2, 0]],
+        ["BEGIN BEGIN \nBEGIN N N BEGIN Y Y\n END N N END", [2]],
+        ["BEGIN Y N Y Y N END", [4]],
+        ["BEGIN END Y Y END BEGIN", []],
+    ]
+
+    for log, answer in tests_part_3:
+        assert part3(log) == answer
+        # every way of cutting the log in two chunks gives the same answer
+        for cut in range(len(log) + 1):
+            assert list(part4([log[:cut], log[cut:]])) == answer
+        assert list(part4(log)) == answer
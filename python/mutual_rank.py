@@ -48,9 +48,29 @@
 #  * // if b's second choice becomes their first choice, no mutually-ranked pairings are affected
 #  * changed_pairings('b', 1) // returns []
 
+import collections
+import functools
+import itertools
+import random
+import threading
 
 user_wishlists = {'a': ['c', 'd'], 'b': ['d', 'a', 'c'], 'c': ['a', 'b'], 'd': ['c', 'a', 'b'] }
 
+# apply_bump swaps two entries in place while holding this lock, and the readers
+# below take it too, so none of them can see a wishlist halfway through a swap.
+# it's reentrant because apply_bump calls changed_pairings with it held.
+# iter_mutual_pairs/all_mutual_pairs don't take it, concurrent whole-network
+# reads should hold it themselves or go through MutualRankIndex
+wishlists_lock = threading.RLock()
+
+def _holding_wishlists_lock(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with wishlists_lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+@_holding_wishlists_lock
 def has_mutual_pair_for_rank(user, rank):
     if user not in user_wishlists:
         raise AssertionError("incorect data")
@@ -159,7 +179,15 @@ def changed_pairings_older(user, rank):
     
     return res
 
+def ranks_user_at(other, rank, user):
+    # True if `other` has `user` at `rank` on their wishlist
+    opposite_wishlist = user_wishlists[other]
+    return rank < len(opposite_wishlist) and opposite_wishlist[rank] == user
+
+@_holding_wishlists_lock
 def changed_pairings(user, rank):
+    # evaluates the swap without doing it: after the bump right_entry sits at
+    # rank-1 and left_entry at rank, so only those two lookups are needed
     if rank < 1:
         raise AssertionError("rank too small")
     
@@ -176,23 +204,151 @@ def changed_pairings(user, rank):
     if right_mutual:
         res.append(right_entry)
 
-    swapped_wl = user_wl.copy()
-    swapped_wl[rank-1], swapped_wl[rank] = swapped_wl[rank], swapped_wl[rank-1]
-    user_wishlists[user] = swapped_wl
-
-    left_mutual = has_mutual_pair_for_rank(user, rank-1)
-    right_mutual = has_mutual_pair_for_rank(user, rank)
-
-    if left_mutual:
+    if ranks_user_at(right_entry, rank-1, user):
         res.append(right_entry)
-    if right_mutual:
+    if ranks_user_at(left_entry, rank, user):
         res.append(left_entry)
 
-    user_wishlists[user] = user_wl
+    return res
 
+def apply_bump(user, rank):
+    # bumps the entry at rank above the one before it and returns the changed
+    # pairings, as one step for everything that holds wishlists_lock
+    with wishlists_lock:
+        res = changed_pairings(user, rank)
+        user_wl = user_wishlists[user]
+        user_wl[rank-1], user_wl[rank] = user_wl[rank], user_wl[rank-1]
     return res
 
-    
+
+def iter_mutual_pairs(wishlists=None):
+    # every mutually ranked pair in the network as (rank, user, other), user < other.
+    # one pass over all wishlist entries with an O(1) check each, and nothing
+    # is kept between entries, so it can stream over very large networks
+    if wishlists is None:
+        wishlists = user_wishlists
+    for user, wishlist in wishlists.items():
+        for rank, other in enumerate(wishlist):
+            # each pair shows up from both sides, only report it from the smaller name
+            if other <= user:
+                continue
+            opposite_wishlist = wishlists.get(other)
+            if opposite_wishlist is not None and rank < len(opposite_wishlist) and opposite_wishlist[rank] == user:
+                yield rank, user, other
+
+def all_mutual_pairs(wishlists=None):
+    # {rank: [(user, other), ...]} for the whole network
+    res = collections.defaultdict(list)
+    for rank, user, other in iter_mutual_pairs(wishlists):
+        res[rank].append((user, other))
+    return dict(res)
+
+
+class MutualRankIndex:
+    # wishlists plus a {target: rank} index per user and the set of mutually
+    # ranked pairs, so mutual checks and changed_pairings never scan a wishlist.
+    # bump() keeps all three in sync; only the pairs between the user and the
+    # two swapped entries can change, so that's all it touches
+
+    def __init__(self, wishlists) -> None:
+        self.wishlists = {user: list(wishlist) for user, wishlist in wishlists.items()}
+        self.ranks = {user: {target: rank for rank, target in enumerate(wishlist)}
+                      for user, wishlist in self.wishlists.items()}
+        self.mutual = set()
+        for user, wishlist in self.wishlists.items():
+            for rank, target in enumerate(wishlist):
+                if self.rank_of(target, user) == rank:
+                    self.mutual.add(frozenset((user, target)))
+
+    def rank_of(self, user, target):
+        # where user ranks target, None if it's not on their wishlist
+        ranks = self.ranks.get(user)
+        return None if ranks is None else ranks.get(target)
+
+    def is_mutual(self, user, other):
+        return frozenset((user, other)) in self.mutual
+
+    def has_mutual_pair_for_rank(self, user, rank):
+        if user not in self.wishlists:
+            raise AssertionError("incorect data")
+        wishlist = self.wishlists[user]
+        if rank >= len(wishlist):
+            return False
+        return self.is_mutual(user, wishlist[rank])
+
+    def has_mutual_first_choice(self, user):
+        return self.has_mutual_pair_for_rank(user, 0)
+
+    def changed_pairings(self, user, rank):
+        # same answer, in the same order, as changed_pairings()
+        if rank < 1:
+            raise AssertionError("rank too small")
+        wishlist = self.wishlists[user]
+        left_entry = wishlist[rank-1]
+        right_entry = wishlist[rank]
+        left_rank = self.rank_of(left_entry, user)
+        right_rank = self.rank_of(right_entry, user)
+
+        res = []
+        # pairings that are mutual now and won't be after the swap
+        if left_rank == rank - 1:
+            res.append(left_entry)
+        if right_rank == rank:
+            res.append(right_entry)
+        # pairings that become mutual after the swap
+        if right_rank == rank - 1:
+            res.append(right_entry)
+        if left_rank == rank:
+            res.append(left_entry)
+        return res
+
+    def bump(self, user, rank):
+        # swaps the entry at rank with the one above it, returns changed_pairings
+        res = self.changed_pairings(user, rank)
+        wishlist = self.wishlists[user]
+        ranks = self.ranks[user]
+        left_entry, right_entry = wishlist[rank-1], wishlist[rank]
+        wishlist[rank-1], wishlist[rank] = right_entry, left_entry
+        ranks[right_entry], ranks[left_entry] = rank - 1, rank
+        # every pair in res flips, the rest of the set is untouched
+        mutual = self.mutual
+        for other in res:
+            pair = frozenset((user, other))
+            if pair in mutual:
+                mutual.remove(pair)
+            else:
+                mutual.add(pair)
+        return res
+
+
+def replay_bumps(events, index=None, batch_size=1000):
+    # applies (user, rank) bump events in order and, after every batch_size
+    # events, yields the pairings whose mutually-ranked status changed during
+    # that batch as (user, other, is_mutual_now). a pairing that flips and
+    # flips back inside one batch is not reported. batch_size=1 reports
+    # exactly what changed_pairings says for each event
+    if index is None:
+        index = MutualRankIndex(user_wishlists)
+    events = iter(events)
+    while True:
+        batch = list(itertools.islice(events, batch_size))
+        if not batch:
+            return
+        touched = {} # pair -> ((user, other), status before the batch)
+        for user, rank in batch:
+            for other in index.bump(user, rank):
+                pair = frozenset((user, other))
+                if pair not in touched:
+                    # every reported pairing flipped, so it was the opposite before
+                    touched[pair] = ((user, other), not index.is_mutual(user, other))
+        yield [(user, other, not was_mutual) for pair, ((user, other), was_mutual) in touched.items()
+               if index.is_mutual(user, other) != was_mutual]
+
+
+def random_wishlists(users, wishlist_length, seed=0):
+    rng = random.Random(seed)
+    names = [f'u{i}' for i in range(users)]
+    return {name: rng.sample([other for other in names if other != name], wishlist_length) for name in names}
 
 
 def test():
@@ -216,5 +372,130 @@ def test():
 #  * // if b's second choice becomes their first choice, no mutually-ranked pairings are affected
     assert changed_pairings('b', 1) == []
 
-
-test()
\ No newline at end of file
+def test_apply_bump():
+    global user_wishlists
+    original = user_wishlists
+    try:
+        user_wishlists = {user: list(wishlist) for user, wishlist in original.items()}
+        before = {user: list(wishlist) for user, wishlist in user_wishlists.items()}
+        assert changed_pairings('d', 1) == ['a']
+        assert user_wishlists == before
+        held = user_wishlists['d']
+        assert apply_bump('d', 1) == ['a']
+        assert user_wishlists['d'] == ['a', 'c', 'b']
+        # swapped in place, no copy of the wishlist
+        assert held is user_wishlists['d']
+        # bumping it back restores the pairing
+        assert apply_bump('d', 1) == ['a']
+        assert user_wishlists == before
+
+        user_wishlists = random_wishlists(30, 6, seed=3)
+        index = MutualRankIndex(user_wishlists)
+        rng = random.Random(4)
+        for _ in range(2000):
+            user, rank = rng.choice(list(user_wishlists)), rng.randint(1, 5)
+            assert apply_bump(user, rank) == index.bump(user, rank)
+        assert index.wishlists == user_wishlists
+
+        # readers holding the lock never catch a wishlist mid swap
+        torn = []
+        def read():
+            for _ in range(2000):
+                with wishlists_lock:
+                    torn.extend(user for user, wishlist in user_wishlists.items() if len(set(wishlist)) != len(wishlist))
+                changed_pairings(rng.choice(list(user_wishlists)), 1)
+        reader = threading.Thread(target=read)
+        reader.start()
+        bump_rng = random.Random(5)
+        for _ in range(5000):
+            apply_bump(bump_rng.choice(list(user_wishlists)), bump_rng.randint(1, 5))
+        reader.join()
+        assert torn == []
+    finally:
+        user_wishlists = original
+
+def test_all_mutual_pairs():
+    assert all_mutual_pairs() == {0: [('a', 'c')], 1: [('a', 'd')]}
+    assert list(iter_mutual_pairs({'a': ['b'], 'b': ['c', 'a'], 'c': ['a']})) == []
+    assert all_mutual_pairs({}) == {}
+
+    wishlists = random_wishlists(60, 5, seed=5)
+    # plant some mutual first choices, random wishlists rarely have any
+    for user in list(wishlists)[:10]:
+        opposite_wishlist = wishlists[wishlists[user][0]]
+        if user not in opposite_wishlist:
+            opposite_wishlist[0] = user
+    expected = collections.defaultdict(set)
+    index = MutualRankIndex(wishlists)
+    for user, wishlist in wishlists.items():
+        for rank, other in enumerate(wishlist):
+            if index.has_mutual_pair_for_rank(user, rank):
+                expected[rank].add(tuple(sorted((user, other))))
+    report = all_mutual_pairs(wishlists)
+    assert {rank: set(pairs) for rank, pairs in report.items()} == expected
+    assert sum(map(len, report.values())) == len(index.mutual)
+
+def test_replay_bumps():
+    assert list(replay_bumps([('d', 1), ('d', 1)], batch_size=1)) == [[('d', 'a', False)], [('d', 'a', True)]]
+    assert list(replay_bumps([('d', 1), ('d', 1)], batch_size=2)) == [[]]
+    assert list(replay_bumps([])) == []
+
+    wishlists = random_wishlists(40, 5, seed=6)
+    rng = random.Random(7)
+    events = [(rng.choice(list(wishlists)), rng.randint(1, 4)) for _ in range(3000)]
+
+    index = MutualRankIndex(wishlists)
+    per_event = [changes for changes in replay_bumps(events, index, batch_size=1)]
+    check = MutualRankIndex(wishlists)
+    for (user, rank), changes in zip(events, per_event):
+        assert sorted(other for _, other, _ in changes) == sorted(check.bump(user, rank))
+
+    index = MutualRankIndex(wishlists)
+    before = set(index.mutual)
+    for changes in replay_bumps(events, index, batch_size=128):
+        after = set(index.mutual)
+        assert {frozenset((user, other)) for user, other, _ in changes} == before ^ after
+        assert all(is_mutual == (frozenset((user, other)) in after) for user, other, is_mutual in changes)
+        before = after
+
+def test_index():
+    global user_wishlists
+    index = MutualRankIndex(user_wishlists)
+    assert index.has_mutual_first_choice('a')
+    assert not index.has_mutual_first_choice('b')
+    assert index.has_mutual_pair_for_rank('a', 1)
+    assert not index.has_mutual_pair_for_rank('d', 2)
+    assert index.mutual == {frozenset('ac'), frozenset('ad')}
+    assert index.changed_pairings('d', 1) == ['a']
+    assert index.changed_pairings('b', 2) == ['c']
+    assert index.changed_pairings('b', 1) == []
+
+    # random bumps, checked against the list based functions on the same data
+    original = user_wishlists
+    try:
+        user_wishlists = random_wishlists(30, 6, seed=1)
+        index = MutualRankIndex(user_wishlists)
+        rng = random.Random(2)
+        for _ in range(2000):
+            user = rng.choice(list(user_wishlists))
+            rank = rng.randint(1, 5)
+            expected = changed_pairings(user, rank)
+            assert index.changed_pairings(user, rank) == expected
+            assert index.bump(user, rank) == expected
+            wishlist = user_wishlists[user]
+            wishlist[rank-1], wishlist[rank] = wishlist[rank], wishlist[rank-1]
+        assert index.wishlists == user_wishlists
+        assert index.mutual == MutualRankIndex(user_wishlists).mutual
+        for user in user_wishlists:
+            for rank in range(6):
+                assert index.has_mutual_pair_for_rank(user, rank) == has_mutual_pair_for_rank(user, rank)
+    finally:
+        user_wishlists = original
+
+
+if __name__ == "__main__":
+    test()
+    test_apply_bump()
+    test_all_mutual_pairs()
+    test_replay_bumps()
+    test_index()
@@ -1,5 +1,10 @@
 
 import collections
+import concurrent.futures
+import functools
+import itertools
+import random
+import time
 
 
 def part1():
@@ -78,7 +83,12 @@ def part3():
 
 def parse_accept_language(language_header, supported_languages):
 
-    return parse_accept_language4(language_header, supported_languages)
+    return _negotiator(tuple(supported_languages)).negotiate(language_header)
+
+@functools.lru_cache(maxsize=16)
+def _negotiator(supported_languages):
+    # one negotiator per supported list, callers pass the same list on every request
+    return LanguageNegotiator(supported_languages)
 
 def parse_accept_language1(language_header, supported_languages):
 
@@ -93,62 +103,57 @@ def parse_accept_language1(language_header, supported_languages):
     
     return compatible_languages
 
+def _language_groups(supported_languages):
+    # base language -> its supported tags, in supported order
+    grouped_languages = collections.defaultdict(list)
+    for lang in supported_languages:
+        grouped_languages[lang.split('-')[0]].append(lang)
+    return grouped_languages
+
 def parse_accept_language2(language_header, supported_languages):
 
     supported_languages_set = set(supported_languages)
-    grouped_languages = collections.defaultdict(set)
+    grouped_languages = _language_groups(supported_languages)
 
-    for lang in supported_languages:
-        language, region = lang.split('-')
-        grouped_languages[language].add(region)
-
-    compatible_languages = []
+    # dict as an ordered set, membership checks are O(1) instead of a list scan
+    compatible_languages = {}
 
     for language in language_header.split(","):
         language = language.strip()
 
         is_regional = '-' in language
         if not is_regional:
-            for region in grouped_languages[language]:
-                possible_language = f'{language}-{region}'
-                if possible_language not in compatible_languages:
-                    compatible_languages.append(possible_language)
+            for possible_language in grouped_languages.get(language, ()):
+                compatible_languages.setdefault(possible_language)
 
         elif language in supported_languages_set:
-            compatible_languages.append(language)
+            compatible_languages.setdefault(language)
     
-    return compatible_languages
+    return list(compatible_languages)
 
 def parse_accept_language3(language_header, supported_languages):
 
     supported_languages_set = set(supported_languages)
-    grouped_languages = collections.defaultdict(set)
+    grouped_languages = _language_groups(supported_languages)
 
-    for lang in supported_languages:
-        language, region = lang.split('-')
-        grouped_languages[language].add(region)
-
-    compatible_languages = []
+    compatible_languages = {}
 
     for language in language_header.split(","):
         language = language.strip()
 
         is_regional = '-' in language
         if not is_regional:
-            for region in grouped_languages[language]:
-                possible_language = f'{language}-{region}'
-                if possible_language not in compatible_languages:
-                    compatible_languages.append(possible_language)
+            for possible_language in grouped_languages.get(language, ()):
+                compatible_languages.setdefault(possible_language)
 
         elif language in supported_languages_set:
-            compatible_languages.append(language)
+            compatible_languages.setdefault(language)
         
         if language == "*":
             for L in supported_languages:
-                if L not in compatible_languages:
-                    compatible_languages.append(L)
+                compatible_languages.setdefault(L)
     
-    return compatible_languages
+    return list(compatible_languages)
 
 def parse_accept_language4(language_header, supported_languages):
     # 	Part 4
@@ -210,31 +215,215 @@ def parse_accept_language4(language_header, supported_languages):
     return [ lang for weight, lang in sorted_languages ]
 
 
+# params string (everything after the tag's first ';') -> q-value. headers repeat
+# the same handful of ";q=0.8" strings, so most entries skip the param parsing
+_Q_VALUES = {}
+_Q_VALUES_MAX = 1024
+
+def _q_value(params):
+    # q from "q=0.5" or " level=1; q = .5", a missing or malformed q-value means 1.
+    # out of range values are clamped to [0, 1] so a bad entry can't jump the queue
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip() in ("q", "Q"):
+            try:
+                value = float(value)
+            except ValueError:
+                return 1.0
+            if value != value: # nan
+                return 1.0
+            return min(max(value, 0.0), 1.0)
+    return 1.0
+
+def tokenize_accept_language(language_header):
+    # [(tag, q), ...] in header order, empty entries are dropped.
+    # one pass over the entries, str methods do the scanning since a python
+    # level character loop or a regex are both slower than split() here
+    res = []
+    append = res.append
+    for entry in language_header.split(","):
+        tag, has_params, params = entry.partition(";")
+        tag = tag.strip()
+        if not tag:
+            continue
+        if not has_params:
+            append((tag, 1.0))
+            continue
+        q = _Q_VALUES.get(params)
+        if q is None:
+            q = _q_value(params)
+            if len(_Q_VALUES) < _Q_VALUES_MAX:
+                _Q_VALUES[params] = q
+        append((tag, q))
+    return res
+
+
+class _SubtagNode:
+
+    def __init__(self) -> None:
+        self.children = {} # lowercased subtag -> _SubtagNode
+        self.tag = None # the supported tag ending here, as spelled in the supported list
+        self.subtree = [] # every supported tag at or below this node, in supported order
+
+
+class SubtagTrie:
+    # supported tags indexed subtag by subtag, so "zh" -> "zh-Hant" -> "zh-Hant-TW"
+    # is a walk of len(tag.split("-")) dict lookups however big the catalog gets.
+    # matching is case insensitive, BCP 47 tags are
+
+    def __init__(self, supported_languages) -> None:
+        self.root = _SubtagNode()
+        for tag in supported_languages:
+            path = [self.root]
+            for subtag in tag.lower().split("-"):
+                path.append(path[-1].children.setdefault(subtag, _SubtagNode()))
+            if path[-1].tag is not None:
+                # same tag listed twice, keep the first spelling
+                continue
+            path[-1].tag = tag
+            for node in path:
+                node.subtree.append(tag)
+
+    def find(self, tag):
+        # node for tag, None when no supported tag starts with it
+        node = self.root
+        for subtag in tag.lower().split("-"):
+            node = node.children.get(subtag)
+            if node is None:
+                return None
+        return node
+
+
+class LanguageNegotiator:
+    # parse_accept_language4 for a supported list that's fixed at startup. the
+    # subtag trie is built once, and answers are cached per raw header string so
+    # a repeated header doesn't get parsed again.
+    # differences from parse_accept_language4: an explicit tag has to be supported,
+    # entries without a q-value weigh 1, tags of any depth work ("en", "zh-Hant-TW")
+    # and prefix/wildcard expansion follows the order of the supported list
+
+    def __init__(self, supported_languages, cache_size=1024) -> None:
+        self.supported_languages = list(supported_languages)
+        self.trie = SubtagTrie(self.supported_languages)
+        # per instance so every negotiator gets its own cache and counters
+        self._cached_negotiate = functools.lru_cache(maxsize=cache_size)(self._negotiate)
+
+    def negotiate(self, language_header):
+        # a fresh list every call, callers are free to mutate it
+        return list(self._cached_negotiate(language_header))
+
+    def cache_info(self):
+        # hits, misses, maxsize, currsize
+        return self._cached_negotiate.cache_info()
+
+    def cache_clear(self):
+        self._cached_negotiate.cache_clear()
+
+    def _negotiate(self, language_header):
+        weights = {}
+        for lang, weight in tokenize_accept_language(language_header):
+            node = self.trie.root if lang == "*" else self.trie.find(lang)
+            if node is None:
+                continue
+            if node.tag is not None and lang != "*":
+                # an exact match overrides a weight picked up from a prefix or wildcard entry
+                weights[node.tag] = weight
+            for lang_code in node.subtree:
+                if lang_code not in weights:
+                    weights[lang_code] = weight
+        # sorted is stable so equal weights keep header order
+        return tuple(sorted(weights, key=lambda lang_code: -weights[lang_code]))
+
+
+class BatchStats:
+    # running totals for negotiate_many, seconds only counts time spent
+    # negotiating, not time the caller spends consuming results
+
+    def __init__(self) -> None:
+        self.headers = 0
+        self.negotiated = 0 # distinct headers that actually went through the negotiator
+        self.seconds = 0.0
+
+    @property
+    def headers_per_second(self):
+        return self.headers / self.seconds if self.seconds else 0.0
+
+
+_worker_negotiator = None
+
+def _init_worker(supported_languages):
+    # runs once in every pool process so the trie isn't pickled with each task
+    global _worker_negotiator
+    _worker_negotiator = LanguageNegotiator(supported_languages, cache_size=0)
+
+def _negotiate_in_worker(language_header):
+    return _worker_negotiator._negotiate(language_header)
+
+def negotiate_many(language_headers, supported_languages, processes=0, batch_size=10**5, memo_size=10**6, stats=None):
+    # parse_accept_language for every header of an iterator, as tuples, in input order.
+    # headers are read batch_size at a time, each batch is deduplicated and only
+    # headers that haven't been seen before get negotiated, on a pool of
+    # processes when asked for. answers are remembered for the next batches until
+    # memo_size distinct headers are stored, after that new ones are only reused
+    # within their batch
+    supported_languages = tuple(supported_languages)
+    stats = BatchStats() if stats is None else stats
+    negotiator = LanguageNegotiator(supported_languages, cache_size=0)
+    memo = {}
+    pool = None
+    if processes:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(supported_languages,))
+    try:
+        language_headers = iter(language_headers)
+        while True:
+            batch = list(itertools.islice(language_headers, batch_size))
+            if not batch:
+                break
+            start = time.perf_counter()
+            missing = [header for header in dict.fromkeys(batch) if header not in memo]
+            if pool is None:
+                answers = map(negotiator._negotiate, missing)
+            else:
+                answers = pool.map(_negotiate_in_worker, missing, chunksize=max(1, len(missing) // (processes * 4)))
+            fresh = dict(zip(missing, answers))
+            for header, answer in fresh.items():
+                if len(memo) >= memo_size:
+                    break
+                memo[header] = answer
+            res = [memo[header] if header in memo else fresh[header] for header in batch]
+            stats.headers += len(batch)
+            stats.negotiated += len(missing)
+            stats.seconds += time.perf_counter() - start
+            yield from res
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
 def main():
-    # parse_accept_language()
-    # assert parse_accept_language("en-US, fr-CA, fr-FR", ["fr-FR", "en-US"]) == ["en-US", "fr-FR"]
-    # assert parse_accept_language("fr-CA, fr-FR", ["en-US", "fr-FR"]) == ["fr-FR"]
-    # assert parse_accept_language("en-US", ["en-US", "fr-CA"]) == ["en-US"]
-    # assert parse_accept_language("en-GB", []) == []
-    # assert parse_accept_language("en-GB", ["en-US"]) == []
-    # assert parse_accept_language("en-US, fr-CA, fr-FR", ["en-US", "fr-CA", "fr-FR"][::-1]) == ["en-US", "fr-CA", "fr-FR"]
+    assert parse_accept_language("en-US, fr-CA, fr-FR", ["fr-FR", "en-US"]) == ["en-US", "fr-FR"]
+    assert parse_accept_language("fr-CA, fr-FR", ["en-US", "fr-FR"]) == ["fr-FR"]
+    assert parse_accept_language("en-US", ["en-US", "fr-CA"]) == ["en-US"]
+    assert parse_accept_language("en-GB", []) == []
+    assert parse_accept_language("en-GB", ["en-US"]) == []
+    assert parse_accept_language("en-US, fr-CA, fr-FR", ["en-US", "fr-CA", "fr-FR"][::-1]) == ["en-US", "fr-CA", "fr-FR"]
     
     
-    # assert parse_accept_language("en", ["en-US", "fr-CA", "fr-FR"]) == ["en-US"]
-    # # assert parse_accept_language("fr", ["en-US", "fr-CA", "fr-FR"]) == ["fr-CA", "fr-FR"]    
-    # assert parse_accept_language("fr-FR, fr", ["en-US", "fr-CA", "fr-FR"]) == ["fr-FR", "fr-CA"]
+    assert parse_accept_language("en", ["en-US", "fr-CA", "fr-FR"]) == ["en-US"]
+    assert parse_accept_language("fr", ["en-US", "fr-CA", "fr-FR"]) == ["fr-CA", "fr-FR"]    
+    assert parse_accept_language("fr-FR, fr", ["en-US", "fr-CA", "fr-FR"]) == ["fr-FR", "fr-CA"]
     # # assert parse_accept_language("fr, fr-CA, fr-FR", ["fr-FR", "en-US"]) == ["fr-FR"] NOT ALLOWED RN
-    # assert parse_accept_language("es, ru", ["en-US", "fr-FR"]) == []
-    # assert parse_accept_language("ru", []) == []
-    # assert parse_accept_language("en-GB, en", []) == []
+    assert parse_accept_language("es, ru", ["en-US", "fr-FR"]) == []
+    assert parse_accept_language("ru", []) == []
+    assert parse_accept_language("en-GB, en", []) == []
 
-    # assert parse_accept_language("en, *", ["en-US", "fr-CA", "fr-FR"]) == ["en-US", "fr-CA", "fr-FR"]
+    assert parse_accept_language("en, *", ["en-US", "fr-CA", "fr-FR"]) == ["en-US", "fr-CA", "fr-FR"]
     # # assert parse_accept_language("*, fr", ["en-US", "fr-CA", "fr-FR"]) == ["fr-CA", "fr-FR"]    NOT ALLOWED
-    # assert parse_accept_language("fr-FR, *", ["en-US", "fr-CA", "fr-FR"]) == ["fr-FR", "en-US", "fr-CA"]
-    # assert parse_accept_language("es, ru, *", ["en-US", "fr-FR"]) == ["en-US", "fr-FR"]
-    # assert parse_accept_language("es, en-CA, *", ["en-US", "fr-FR"]) == ["en-US", "fr-FR"]
-    # assert parse_accept_language("*", ["en-US"]) == ["en-US"]
-    # assert parse_accept_language("*", []) == []
+    assert parse_accept_language("fr-FR, *", ["en-US", "fr-CA", "fr-FR"]) == ["fr-FR", "en-US", "fr-CA"]
+    assert parse_accept_language("es, ru, *", ["en-US", "fr-FR"]) == ["en-US", "fr-FR"]
+    assert parse_accept_language("es, en-CA, *", ["en-US", "fr-FR"]) == ["en-US", "fr-FR"]
+    assert parse_accept_language("*", ["en-US"]) == ["en-US"]
+    assert parse_accept_language("*", []) == []
 
     assert parse_accept_language("fr-FR;q=1, fr-CA;q=0, fr;q=0.5", ["fr-FR", "fr-CA", "fr-BG"]) == ["fr-FR", "fr-BG", "fr-CA"]
     assert parse_accept_language("fr-FR;q=1, fr-CA;q=0, *;q=0.5", ["fr-FR", "fr-CA", "fr-BG", "en-US"]) == ["fr-FR", "fr-BG", "en-US", "fr-CA"]
@@ -243,6 +432,162 @@ def main():
 
 
 
-
-main()
-	
+def test_tokenize_accept_language():
+    assert tokenize_accept_language("fr-FR;q=1, fr-CA;q=0, *;q=0.5") == [("fr-FR", 1.0), ("fr-CA", 0.0), ("*", 0.5)]
+    assert tokenize_accept_language("en-US,fr") == [("en-US", 1.0), ("fr", 1.0)]
+    assert tokenize_accept_language("  en ; q = .8 ,, de;level=1;q=0.3 , *") == [("en", 0.8), ("de", 0.3), ("*", 1.0)]
+    assert tokenize_accept_language("en;q=abc, fr;q=1., de;q=2, es;q=nan, it;q=-1") == [("en", 1.0), ("fr", 1.0), ("de", 1.0), ("es", 1.0), ("it", 0.0)]
+    assert parse_accept_language("en-US;q=0.5, fr-FR;q=-1", ["en-US", "fr-FR"]) == ["en-US", "fr-FR"]
+    assert parse_accept_language("en-US;q=1, fr-FR;q=5", ["en-US", "fr-FR"]) == ["en-US", "fr-FR"]
+    assert tokenize_accept_language("") == [] and tokenize_accept_language(" , ") == []
+
+
+def benchmark_tokenizer(entries=8, repeat=5, calls=10**5):
+    # tokenize_accept_language against the split() chain of parse_accept_language4,
+    # on headers it can read (every entry carries a q-value)
+    def split_tokens(language_header):
+        res = []
+        for language_weight in language_header.split(","):
+            lang, weight = language_weight.strip().split(";")
+            res.append((lang, float(weight.split('=')[-1])))
+        return res
+
+    rng = random.Random(0)
+    tags = ["en-US", "en-GB", "fr-FR", "fr", "de-DE", "es", "pt-BR", "*"]
+    headers = [", ".join(f"{rng.choice(tags)};q={rng.randint(0, 10) / 10}" for _ in range(entries)) for _ in range(1000)]
+    assert all(split_tokens(header) == tokenize_accept_language(header) for header in headers)
+    for name, func in [("split", split_tokens), ("tokenize_accept_language", tokenize_accept_language)]:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for i in range(calls):
+                func(headers[i % len(headers)])
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:<26} {best / calls * 1e6:.2f}us/header  {calls / best:,.0f} headers/s")
+
+
+def _locales(count):
+    # count supported tags, five regions per language: aa-AA, aa-AB, ..., ab-AA, ...
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    languages = [a + b for a in letters for b in letters]
+    return [f"{languages[i // 5]}-{languages[i % 5].upper()}" for i in range(count)]
+
+def test_subtag_trie():
+    supported = ["zh-Hant-TW", "en", "zh-Hans-CN", "en-US", "zh-Hant-HK", "EN-us", "zh"]
+    trie = SubtagTrie(supported)
+    assert trie.root.subtree == ["zh-Hant-TW", "en", "zh-Hans-CN", "en-US", "zh-Hant-HK", "zh"]
+    assert trie.find("ZH-hant").subtree == ["zh-Hant-TW", "zh-Hant-HK"] and trie.find("zh-Hant").tag is None
+    assert trie.find("en-us").tag == "en-US"
+    assert trie.find("zh-Hant-MO") is None and trie.find("fr") is None
+
+    negotiator = LanguageNegotiator(supported)
+    assert negotiator.negotiate("zh-Hant") == ["zh-Hant-TW", "zh-Hant-HK"]
+    assert negotiator.negotiate("zh-hant-hk, zh;q=0.5") == ["zh-Hant-HK", "zh", "zh-Hant-TW", "zh-Hans-CN"]
+    assert negotiator.negotiate("en") == ["en", "en-US"]
+    # exact match beats the prefix entry that came first, descendants only fill gaps
+    assert negotiator.negotiate("zh;q=0.2, zh-Hans-CN") == ["zh-Hans-CN", "zh", "zh-Hant-TW", "zh-Hant-HK"]
+    assert negotiator.negotiate("*;q=0.1, en-US;q=0.9, en;q=0.5") == ["en-US", "en", "zh-Hant-TW", "zh-Hans-CN", "zh-Hant-HK", "zh"]
+    assert parse_accept_language("zh-Hant-TW, en", ["en", "zh-Hant-TW"]) == ["zh-Hant-TW", "en"]
+
+
+def test_linear_expansion():
+    supported = _locales(500)
+    assert parse_accept_language3("*", supported) == supported
+    assert parse_accept_language3("ab-AC, ab, *", supported) == ["ab-AC", "ab-AA", "ab-AB", "ab-AD", "ab-AE"] + supported[:5] + supported[10:]
+    assert parse_accept_language2("ab, ab-AC, zz", supported) == supported[5:10]
+    assert parse_accept_language2("fr, fr-FR", ["en-US", "fr-FR", "fr-CA"]) == ["fr-FR", "fr-CA"]
+    for header in ["ab, *", "ac-AB, aa, *", "zz-ZZ, ad"]:
+        assert parse_accept_language3(header, supported) == LanguageNegotiator(supported).negotiate(header)
+
+
+def benchmark_expansion(locales=500, repeat=5, calls=1000):
+    # base and wildcard expansion on a catalog the size of ours
+    supported = _locales(locales)
+    plain, weighted = "aa, ab, ac, *", "ab-AC;q=0.9, ab;q=0.8, *;q=0.1"
+    negotiator = LanguageNegotiator(supported, cache_size=0)
+    cases = [("parse_accept_language2", parse_accept_language2, plain), ("parse_accept_language3", parse_accept_language3, plain),
+             ("parse_accept_language4", parse_accept_language4, weighted)]
+    cases += [("LanguageNegotiator", lambda header, _: negotiator.negotiate(header), header) for header in (plain, weighted)]
+    for name, func, header in cases:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(calls):
+                func(header, supported)
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:<24} {header:<32} {best / calls * 1e6:.1f}us")
+
+
+def _skewed_headers(count, seed=0):
+    # a few popular headers and a long tail, like real traffic
+    rng = random.Random(seed)
+    tags = ["en-US", "en", "fr-FR", "fr", "de-DE", "zh-Hant-TW", "es", "*"]
+    popular = ["en-US, en;q=0.9", "fr-FR, fr;q=0.8, en;q=0.5", "de-DE", "zh-Hant-TW, zh;q=0.7, *;q=0.1"]
+    res = []
+    for _ in range(count):
+        if rng.random() < 0.9:
+            res.append(rng.choice(popular))
+        else:
+            res.append(", ".join(f"{rng.choice(tags)};q={rng.randint(0, 10) / 10}" for _ in range(rng.randint(1, 4))))
+    return res
+
+def test_negotiate_many():
+    supported = ["en-US", "fr-FR", "fr-CA", "de-DE", "zh-Hant-TW", "zh-Hans-CN"]
+    headers = _skewed_headers(5000)
+    expected = [tuple(parse_accept_language(header, supported)) for header in headers]
+    stats = BatchStats()
+    assert list(negotiate_many(iter(headers), supported, batch_size=700, stats=stats)) == expected
+    assert stats.headers == 5000 and stats.negotiated == len(set(headers)) and stats.headers_per_second > 0
+    # memo full after 3 headers, later batches negotiate the rest again
+    stats = BatchStats()
+    assert list(negotiate_many(headers, supported, batch_size=1000, memo_size=3, stats=stats)) == expected
+    assert stats.negotiated > len(set(headers))
+    assert list(negotiate_many(headers[:2000], supported, processes=2, batch_size=500)) == expected[:2000]
+    assert list(negotiate_many([], supported)) == []
+
+
+def benchmark_batch(count=10**6, processes=0):
+    supported = _locales(500) + ["en-US", "en", "fr-FR", "de-DE", "zh-Hant-TW"]
+    headers = _skewed_headers(count)
+    stats = BatchStats()
+    for _ in negotiate_many(headers, supported, processes=processes, stats=stats):
+        pass
+    print(f"{stats.headers:,} headers, {stats.negotiated:,} negotiated, {stats.headers_per_second:,.0f} headers/s")
+
+
+def test_language_negotiator():
+    negotiator = LanguageNegotiator(["fr-FR", "fr-CA", "fr-BG", "en-US"])
+    assert negotiator.negotiate("fr-FR;q=1, fr-CA;q=0, fr;q=0.5") == ["fr-FR", "fr-BG", "fr-CA"]
+    assert negotiator.negotiate("fr-FR;q=1, fr-CA;q=0, *;q=0.5") == ["fr-FR", "fr-BG", "en-US", "fr-CA"]
+    assert negotiator.negotiate("fr-FR;q=1, fr-CA;q=0.8, *;q=0.5") == ["fr-FR", "fr-CA", "fr-BG", "en-US"]
+    # base and wildcard expand in supported order, unsupported regional tags are dropped
+    assert negotiator.negotiate("fr") == ["fr-FR", "fr-CA", "fr-BG"]
+    assert negotiator.negotiate("en-GB, *;q=0.1") == ["fr-FR", "fr-CA", "fr-BG", "en-US"]
+    # explicit tag after a wildcard still wins
+    assert negotiator.negotiate("*;q=0.5, fr-CA;q=0.9") == ["fr-CA", "fr-FR", "fr-BG", "en-US"]
+    assert negotiator.negotiate("es, ru") == []
+
+    negotiator.cache_clear()
+    first = negotiator.negotiate("en-US, fr;q=0.5")
+    first.append("mutated")
+    assert negotiator.negotiate("en-US, fr;q=0.5") == ["en-US", "fr-FR", "fr-CA", "fr-BG"]
+    info = negotiator.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+
+    small = LanguageNegotiator(["en-US"], cache_size=2)
+    for header in ["en", "en-US", "*", "en"]:
+        small.negotiate(header)
+    assert small.cache_info().currsize == 2 and small.cache_info().misses == 4
+    assert LanguageNegotiator([]).negotiate("*") == []
+
+
+if __name__ == "__main__":
+    main()
+    test_tokenize_accept_language()
+    test_language_negotiator()
+    test_linear_expansion()
+    test_subtag_trie()
+    test_negotiate_many()
+    # benchmark_tokenizer()
+    # benchmark_expansion()
+    # benchmark_batch()
@@ -31,7 +31,21 @@
 # # >> tracker.allocate("sitebox")
 # # "sitebox1"
 
+import array
+import asyncio
 import collections
+import contextlib
+import functools
+import heapq
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
 
 class NumberAllocator:
 
@@ -46,32 +60,517 @@ class NumberAllocator:
         
         return len(allocated) + 1
 
-class ServerTracker:
+class NumberPool:
+    # stateful version of next_server_number for one host type.
+    # every number up to high_water has been handed out at some point, the
+    # ones given back since are kept in a min-heap, so the lowest available
+    # number is either the top of the heap or high_water + 1
 
     def __init__(self) -> None:
-        self.servers = collections.defaultdict(list)
+        self.high_water = 0
+        self.free = []
+        self.allocated = set()
+
+    def allocate(self):
+        if self.free:
+            num = heapq.heappop(self.free)
+        else:
+            self.high_water += 1
+            num = self.high_water
+        self.allocated.add(num)
+        return num
+
+    def release(self, num):
+        if num not in self.allocated:
+            raise ValueError(f"{num} is not allocated")
+        self.allocated.remove(num)
+        heapq.heappush(self.free, num)
+
+    def allocate_many(self, count):
+        # the `count` lowest available numbers, same as calling allocate() count times
+        if count < 0:
+            raise ValueError(f"count must be non-negative, got {count}")
+        if count >= len(self.free):
+            nums = sorted(self.free)
+            self.free = []
+        else:
+            nums = [heapq.heappop(self.free) for _ in range(count)]
+        fresh = count - len(nums)
+        nums.extend(range(self.high_water + 1, self.high_water + 1 + fresh))
+        self.high_water += fresh
+        self.allocated.update(nums)
+        return nums
+
+    def check_release(self, nums):
+        # raises ValueError unless every number is allocated and listed once
+        nums = set(nums)
+        missing = nums - self.allocated
+        if missing:
+            raise ValueError(f"{min(missing)} is not allocated")
+        return nums
+
+    def release_many(self, nums):
+        nums = list(nums)
+        unique = self.check_release(nums)
+        if len(unique) != len(nums):
+            raise ValueError("duplicate numbers in release")
+        self.allocated -= unique
+        if len(nums) > len(self.free):
+            self.free.extend(nums)
+            heapq.heapify(self.free)
+        else:
+            for num in nums:
+                heapq.heappush(self.free, num)
+
+    def take(self, num):
+        # marks a specific number as allocated, used when replaying a journal
+        if num in self.allocated:
+            raise ValueError(f"{num} is already allocated")
+        if self.free and self.free[0] == num:
+            heapq.heappop(self.free)
+        elif num > self.high_water:
+            self.free.extend(range(self.high_water + 1, num))
+            heapq.heapify(self.free)
+            self.high_water = num
+        else:
+            self.free.remove(num)
+            heapq.heapify(self.free)
+        self.allocated.add(num)
+
+    @classmethod
+    def from_allocated(cls, nums):
+        pool = cls()
+        pool.allocated = set(nums)
+        pool.high_water = max(pool.allocated, default=0)
+        # a sorted list is already a valid heap
+        pool.free = [num for num in range(1, pool.high_water) if num not in pool.allocated]
+        return pool
+
+    def __contains__(self, num):
+        return num in self.allocated
+
+    def __iter__(self):
+        return iter(sorted(self.allocated))
+
+    def __len__(self):
+        return len(self.allocated)
+
+class BitmapNumberPool:
+    # NumberPool with the same interface, stored as a bitmap: bit b of words[w]
+    # is number w*64 + b + 1, set while allocated. above it sit summary levels:
+    # bit j of levels[0][s] is set while words[s*64 + j] still has a free bit,
+    # and bit j of levels[k][s] while levels[k-1][s*64 + j] is non zero. the top
+    # level is a single word, so the lowest free number is one lowest-set-bit
+    # lookup per level, top down, whatever was released before.
+    # a million allocated numbers take ~125KB of words plus ~2KB of summaries
+
+    FULL = (1 << 64) - 1
+
+    def __init__(self) -> None:
+        self.words = array.array('Q')
+        self.levels = [array.array('Q')]
+        self.count = 0
+
+    def _mark_free(self, ind):
+        # words[ind] has a free bit, set it in every level up to the first
+        # summary word that was already non zero
+        for level in self.levels:
+            ind, bit = ind >> 6, ind & 63
+            while ind >= len(level):
+                # words added in bulk by allocate_many are full and have no bits here yet
+                level.append(0)
+            was = level[ind]
+            level[ind] = was | (1 << bit)
+            if was:
+                return
+        while len(self.levels[-1]) > 1:
+            # the top outgrew one word, put a new level above it
+            top = self.levels[-1]
+            above = array.array('Q', [0]) * ((len(top) + 63) >> 6)
+            for ind, word in enumerate(top):
+                if word:
+                    above[ind >> 6] |= 1 << (ind & 63)
+            self.levels.append(above)
+
+    def _mark_full(self, ind):
+        # words[ind] just filled up, clear it in every level up to the first
+        # summary word that still has something set
+        for level in self.levels:
+            ind, bit = ind >> 6, ind & 63
+            word = level[ind] & ~(1 << bit)
+            level[ind] = word
+            if word:
+                return
+
+    def _add_word(self):
+        self.words.append(0)
+        self._mark_free(len(self.words) - 1)
+
+    def _set(self, word_ind, bit):
+        word = self.words[word_ind] | (1 << bit)
+        self.words[word_ind] = word
+        if word == self.FULL:
+            self._mark_full(word_ind)
+        self.count += 1
+
+    def allocate(self):
+        top = self.levels[-1]
+        if not top or not top[0]:
+            self._add_word()
+        ind = 0
+        for level in reversed(self.levels):
+            free = level[ind]
+            ind = (ind << 6) + (free & -free).bit_length() - 1
+        word_ind = ind
+        free_bits = ~self.words[word_ind] & self.FULL
+        bit = (free_bits & -free_bits).bit_length() - 1
+        self._set(word_ind, bit)
+        return (word_ind << 6) + bit + 1
+
+    def release(self, num):
+        if num not in self:
+            raise ValueError(f"{num} is not allocated")
+        word_ind, bit = divmod(num - 1, 64)
+        word = self.words[word_ind]
+        self.words[word_ind] = word & ~(1 << bit)
+        if word == self.FULL:
+            self._mark_free(word_ind)
+        self.count -= 1
+
+    def allocate_many(self, count):
+        if count < 0:
+            raise ValueError(f"count must be non-negative, got {count}")
+        nums = []
+        while count and self.count < len(self.words) * 64:
+            nums.append(self.allocate())
+            count -= 1
+        # no free number left below the end, the rest are fresh words
+        start = len(self.words) * 64 + 1
+        full_words, rest = divmod(count, 64)
+        self.words.extend(array.array('Q', [self.FULL]) * full_words)
+        if rest:
+            self._add_word()
+            self.words[-1] = (1 << rest) - 1
+        self.count += count
+        nums.extend(range(start, start + count))
+        return nums
+
+    def check_release(self, nums):
+        nums = set(nums)
+        for num in nums:
+            if num not in self:
+                raise ValueError(f"{num} is not allocated")
+        return nums
+
+    def release_many(self, nums):
+        nums = list(nums)
+        if len(self.check_release(nums)) != len(nums):
+            raise ValueError("duplicate numbers in release")
+        for num in nums:
+            self.release(num)
+
+    def take(self, num):
+        if num < 1 or num in self:
+            raise ValueError(f"can't take {num}")
+        word_ind, bit = divmod(num - 1, 64)
+        while word_ind >= len(self.words):
+            self._add_word()
+        self._set(word_ind, bit)
+
+    @classmethod
+    def from_allocated(cls, nums):
+        pool = cls()
+        for num in sorted(set(nums)):
+            pool.take(num)
+        return pool
+
+    @property
+    def allocated(self):
+        return set(self)
+
+    def __contains__(self, num):
+        word_ind, bit = divmod(num - 1, 64)
+        return 0 <= word_ind < len(self.words) and bool(self.words[word_ind] >> bit & 1)
+
+    def __iter__(self):
+        for word_ind, word in enumerate(self.words):
+            while word:
+                lowest = word & -word
+                yield (word_ind << 6) + lowest.bit_length()
+                word ^= lowest
+
+    def __len__(self):
+        return self.count
+
+class ServerTracker:
+
+    def __init__(self, pool_factory=NumberPool) -> None:
+        # pool_factory is NumberPool or BitmapNumberPool
+        self.pool_factory = pool_factory
+        self.servers = collections.defaultdict(pool_factory)
 
     
     def allocate(self, name):
-        allocated = self.servers[name]
-
-        next_num = NumberAllocator.next_server_number(allocated)
-        allocated.append(next_num)
+        next_num = self.servers[name].allocate()
 
         return f'{name}{next_num}'
     
 
+    def allocate_many(self, name, count):
+        return [f'{name}{num}' for num in self.servers[name].allocate_many(count)]
+
+
     def deallocate(self, name):
-        num_ind = len(name) - 1
-        while name[num_ind].isnumeric():
-            num_ind -= 1
+        base_name, server_num = split_hostname(name)
+        self.servers[base_name].release(server_num)
 
-        base_name = name[:num_ind+1]
-        server_num = name[num_ind+1:]
-        
-        allocated = self.servers[base_name]
-        allocated.remove(int(server_num))
 
+    def deallocate_many(self, names):
+        # all or nothing: nothing is released if any hostname is not allocated
+        grouped = group_hostnames(names)
+
+        for base_name, nums in grouped.items():
+            if len(set(nums)) != len(nums):
+                raise ValueError(f"duplicate {base_name} hostnames in release")
+            self.servers[base_name].check_release(nums)
+        for base_name, nums in grouped.items():
+            self.servers[base_name].release_many(nums)
+
+
+class ConcurrentServerTracker(ServerTracker):
+    # ServerTracker that can be shared between provisioning threads.
+    # every host type has its own lock, so apibox and sitebox never wait on each other
+
+    def __init__(self, pool_factory=NumberPool) -> None:
+        super().__init__(pool_factory)
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def lock_for(self, name):
+        lock = self.locks.get(name)
+        if lock is None:
+            with self.locks_lock:
+                lock = self.locks.setdefault(name, threading.Lock())
+        return lock
+
+    def allocate(self, name):
+        with self.lock_for(name):
+            return super().allocate(name)
+
+    def allocate_many(self, name, count):
+        with self.lock_for(name):
+            return super().allocate_many(name, count)
+
+    def deallocate(self, name):
+        with self.lock_for(split_hostname(name)[0]):
+            super().deallocate(name)
+
+    def deallocate_many(self, names):
+        names = list(names)
+        # always lock host types in the same order so two batches can't deadlock
+        base_names = sorted({split_hostname(name)[0] for name in names})
+        with contextlib.ExitStack() as stack:
+            for base_name in base_names:
+                stack.enter_context(self.lock_for(base_name))
+            super().deallocate_many(names)
+
+
+class AsyncServerTracker:
+    # asyncio facade over a ConcurrentServerTracker, which can also be used by
+    # threads at the same time. the calls are O(log n) and only hold a lock for
+    # that long, so they run inline rather than being pushed to an executor
+
+    def __init__(self, tracker=None) -> None:
+        self.tracker = tracker if tracker is not None else ConcurrentServerTracker()
+
+    async def allocate(self, name):
+        return self.tracker.allocate(name)
+
+    async def allocate_many(self, name, count):
+        return self.tracker.allocate_many(name, count)
+
+    async def deallocate(self, name):
+        self.tracker.deallocate(name)
+
+    async def deallocate_many(self, names):
+        self.tracker.deallocate_many(names)
+
+
+class JournaledServerTracker(ServerTracker):
+    # ServerTracker that survives restarts. every allocate/deallocate is appended
+    # to <path>.journal as "<seq> A|D <host type> <number>", and every
+    # snapshot_every events the allocated numbers are written to <path>.snapshot
+    # as runs of consecutive numbers and the journal starts over. startup loads
+    # the snapshot and replays the journal tail, so it never reads more than
+    # snapshot_every events no matter how long the tracker has been running
+
+    def __init__(self, path, snapshot_every=10000, fsync=False, pool_factory=NumberPool) -> None:
+        super().__init__(pool_factory)
+        self.snapshot_path = path + '.snapshot'
+        self.journal_path = path + '.journal'
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.seq = 0
+        self.since_snapshot = 0
+        self.recover()
+        self.journal = open(self.journal_path, 'a')
+
+    def recover(self):
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            snapshot_seq = snapshot['seq']
+            for name, runs in snapshot['servers'].items():
+                self.servers[name] = self.pool_factory.from_allocated(
+                    num for start, end in runs for num in range(start, end + 1))
+        self.seq = snapshot_seq
+
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'rb+') as f:
+            data = f.read()
+            # a crash can leave half a line at the end, drop it
+            complete = data.rfind(b'\n') + 1
+            for line in data[:complete].decode().splitlines():
+                seq, op, name, num = line.split()
+                seq = int(seq)
+                if seq <= snapshot_seq:
+                    # already in the snapshot, the crash came before the journal was reset
+                    continue
+                if op == 'A':
+                    self.servers[name].take(int(num))
+                else:
+                    self.servers[name].release(int(num))
+                self.seq = seq
+                self.since_snapshot += 1
+            f.truncate(complete)
+
+    def write_events(self, op, name, nums):
+        lines = []
+        for num in nums:
+            self.seq += 1
+            lines.append(f'{self.seq} {op} {name} {num}\n')
+        self.journal.write(''.join(lines))
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        self.since_snapshot += len(lines)
+        if self.since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        servers = {}
+        for name, pool in self.servers.items():
+            runs = []
+            for num in pool:
+                if runs and runs[-1][1] == num - 1:
+                    runs[-1][1] = num
+                else:
+                    runs.append([num, num])
+            if runs:
+                servers[name] = runs
+
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'seq': self.seq, 'servers': servers}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        self.journal.close()
+        self.journal = open(self.journal_path, 'w')
+        self.since_snapshot = 0
+
+    def allocate(self, name):
+        num = self.servers[name].allocate()
+        self.write_events('A', name, [num])
+        return f'{name}{num}'
+
+    def allocate_many(self, name, count):
+        nums = self.servers[name].allocate_many(count)
+        self.write_events('A', name, nums)
+        return [f'{name}{num}' for num in nums]
+
+    def deallocate(self, name):
+        base_name, server_num = split_hostname(name)
+        self.servers[base_name].release(server_num)
+        self.write_events('D', base_name, [server_num])
+
+    def deallocate_many(self, names):
+        names = list(names)
+        super().deallocate_many(names)
+        for base_name, nums in group_hostnames(names).items():
+            self.write_events('D', base_name, nums)
+
+    def close(self):
+        self.journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def bench_contention(thread_counts=(1, 2, 4, 8), ops_per_thread=20000):
+    # allocations per second with every thread on one host type, then with a host type per thread
+    for shared in [True, False]:
+        for threads in thread_counts:
+            tracker = ConcurrentServerTracker()
+
+            def worker(i):
+                name = "apibox" if shared else f"box{i}x"
+                for _ in range(ops_per_thread):
+                    tracker.deallocate(tracker.allocate(name))
+
+            pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+            start = time.perf_counter()
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            label = "shared host type" if shared else "host type per thread"
+            print(f"{label:<22} {threads:>3} threads  {threads * ops_per_thread / elapsed:>12,.0f} allocations/s")
+
+
+_HOSTNAME_RE = re.compile(r'(.*\D)(\d+)')
+
+@functools.lru_cache(maxsize=1 << 16)
+def split_hostname(name):
+    # "apibox12" -> ("apibox", 12)
+    # cached, and host types are interned so the ServerTracker dict lookups
+    # that follow compare by identity
+    match = _HOSTNAME_RE.fullmatch(name)
+    if match is None:
+        raise ValueError(f"invalid hostname {name!r}")
+    return sys.intern(match.group(1)), int(match.group(2))
+
+def parse_hostnames(names):
+    # split_hostname over a batch, e.g. a day of provisioning log to replay
+    return list(map(split_hostname, names))
+
+def group_hostnames(names):
+    # {host type: [numbers]} in the order the hostnames were given
+    grouped = collections.defaultdict(list)
+    for base_name, server_num in parse_hostnames(names):
+        grouped[base_name].append(server_num)
+    return grouped
+
+
+def test_split_hostname():
+    assert split_hostname("apibox12") == ("apibox", 12)
+    assert split_hostname("box2a30") == ("box2a", 30)
+    assert split_hostname("apibox12")[0] is split_hostname("apibox7")[0]
+    assert parse_hostnames(["apibox1", "sitebox2"]) == [("apibox", 1), ("sitebox", 2)]
+    assert group_hostnames(["apibox3", "sitebox2", "apibox1"]) == {"apibox": [3, 1], "sitebox": [2]}
+    for bad in ["apibox", "12", ""]:
+        try:
+            split_hostname(bad)
+            assert False
+        except ValueError:
+            pass
 
 def test_next_server_number():
     assert NumberAllocator.next_server_number([5, 3, 1]) == 2
@@ -88,8 +587,225 @@ def test_server_tracker():
     # breakpoint()
     assert tracker.allocate("apibox") == "apibox1"
     assert tracker.allocate("sitebox") == "sitebox1"
-    
+
+def test_number_pool():
+    pool = NumberPool()
+    assert [pool.allocate() for _ in range(5)] == [1, 2, 3, 4, 5]
+    pool.release(4)
+    pool.release(2)
+    assert pool.allocate() == 2
+    assert pool.allocate() == 4
+    assert pool.allocate() == 6
+    pool.release(6)
+    assert pool.allocate() == 6
+    assert 3 in pool and len(pool) == 6
+    try:
+        pool.release(7)
+        assert False
+    except ValueError:
+        pass
+
+    # same answers as next_server_number on a random churn
+    rng = random.Random(0)
+    pool = NumberPool()
+    allocated = []
+    for _ in range(2000):
+        if allocated and rng.random() < 0.4:
+            num = allocated.pop(rng.randrange(len(allocated)))
+            pool.release(num)
+        else:
+            expected = NumberAllocator.next_server_number(allocated)
+            assert pool.allocate() == expected
+            allocated.append(expected)
+
+def test_bulk_allocate():
+    tracker = ServerTracker()
+    assert tracker.allocate_many("apibox", 3) == ["apibox1", "apibox2", "apibox3"]
+    assert tracker.allocate_many("apibox", 0) == []
+    tracker.deallocate_many(["apibox3", "apibox1"])
+    assert tracker.allocate_many("apibox", 3) == ["apibox1", "apibox3", "apibox4"]
+    for names in [["apibox2", "apibox9"], ["apibox2", "apibox2"], ["apibox2", "sitebox1"]]:
+        try:
+            tracker.deallocate_many(names)
+            assert False
+        except ValueError:
+            pass
+    # failed releases leave everything allocated
+    assert tracker.allocate("apibox") == "apibox5"
+    for factory in [NumberPool, BitmapNumberPool]:
+        tracker = ServerTracker(pool_factory=factory)
+        tracker.allocate_many("apibox", 3)
+        try:
+            tracker.allocate_many("apibox", -2)
+            assert False
+        except ValueError:
+            pass
+        assert tracker.allocate("apibox") == "apibox4"
+
+    # bulk calls match repeated single calls
+    rng = random.Random(1)
+    bulk, single = ServerTracker(), ServerTracker()
+    live = []
+    for _ in range(300):
+        if live and rng.random() < 0.5:
+            rng.shuffle(live)
+            count = rng.randint(1, len(live))
+            released, live = live[:count], live[count:]
+            bulk.deallocate_many(released)
+            for name in released:
+                single.deallocate(name)
+        else:
+            count = rng.randint(0, 20)
+            names = bulk.allocate_many("apibox", count)
+            assert names == [single.allocate("apibox") for _ in range(count)]
+            live.extend(names)
+
+def test_concurrent_tracker():
+    tracker = ConcurrentServerTracker()
+    handed_out = collections.defaultdict(list)
+
+    def worker(name):
+        names = [tracker.allocate(name) for _ in range(300)] + tracker.allocate_many(name, 200)
+        handed_out[name].extend(names)
+        tracker.deallocate_many(names[:250])
+        for hostname in names[250:]:
+            tracker.deallocate(hostname)
+
+    threads = [threading.Thread(target=worker, args=(name,)) for name in ["apibox", "sitebox"] * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for name in ["apibox", "sitebox"]:
+        # no hostname was handed out twice while it was still allocated
+        assert len(tracker.servers[name]) == 0
+        assert len(handed_out[name]) == 2000
+
+    async def provision():
+        async_tracker = AsyncServerTracker()
+        names = await asyncio.gather(*[async_tracker.allocate("apibox") for _ in range(10)])
+        assert sorted(names, key=lambda name: split_hostname(name)[1]) == [f"apibox{num}" for num in range(1, 11)]
+        await async_tracker.deallocate("apibox3")
+        await async_tracker.deallocate_many(["apibox1", "apibox2"])
+        assert await async_tracker.allocate_many("apibox", 4) == ["apibox1", "apibox2", "apibox3", "apibox11"]
+
+    asyncio.run(provision())
+
+def test_bitmap_pool():
+    pool = BitmapNumberPool()
+    assert [pool.allocate() for _ in range(130)] == list(range(1, 131))
+    pool.release(65)
+    pool.release(3)
+    assert pool.allocate_many(3) == [3, 65, 131]
+    pool.take(500)
+    assert 500 in pool and 499 not in pool and 0 not in pool and len(pool) == 132
+    assert list(pool) == list(range(1, 132)) + [500]
+    assert BitmapNumberPool.from_allocated([5, 1, 200]).allocated == {1, 5, 200}
+    for bad in [lambda: pool.release(499), lambda: pool.take(500), lambda: pool.release_many([1, 1])]:
+        try:
+            bad()
+            assert False
+        except ValueError:
+            pass
+
+    # same answers as NumberPool on a random churn
+    rng = random.Random(3)
+    bitmap, heap = BitmapNumberPool(), NumberPool()
+    for _ in range(3000):
+        roll = rng.random()
+        if len(heap) and roll < 0.4:
+            num = rng.choice(sorted(heap.allocated))
+            bitmap.release(num)
+            heap.release(num)
+        elif roll < 0.5:
+            count = rng.randint(0, 70)
+            assert bitmap.allocate_many(count) == heap.allocate_many(count)
+        else:
+            assert bitmap.allocate() == heap.allocate()
+    assert list(bitmap) == list(heap)
+
+    tracker = ServerTracker(pool_factory=BitmapNumberPool)
+    assert tracker.allocate("apibox") == "apibox1"
+    assert tracker.allocate("apibox") == "apibox2"
+    tracker.deallocate("apibox1")
+    assert tracker.allocate("apibox") == "apibox1"
+    assert tracker.allocate_many("sitebox", 2) == ["sitebox1", "sitebox2"]
+
+    pool = BitmapNumberPool()
+    pool.allocate_many(10**5)
+    assert len(pool.words) * pool.words.itemsize <= 10**5 // 8 + 8
+
+    # churn on a million numbers: every lookup walks the same few levels, and
+    # every summary bit still says whether the word below has room
+    size = 1 << 20
+    bitmap, heap = BitmapNumberPool(), NumberPool()
+    assert bitmap.allocate_many(size) == heap.allocate_many(size)
+    rng = random.Random(7)
+    for _ in range(2000):
+        low = rng.randint(1, 1000)
+        if low in heap:
+            bitmap.release(low)
+            heap.release(low)
+        assert bitmap.allocate() == heap.allocate()
+        assert bitmap.allocate() == heap.allocate()
+    assert len(bitmap) == len(heap) and len(bitmap.levels) == 3 and len(bitmap.levels[-1]) == 1
+    below = [word != BitmapNumberPool.FULL for word in bitmap.words]
+    for level in bitmap.levels:
+        assert [bool(level[i >> 6] >> (i & 63) & 1) if i >> 6 < len(level) else False for i in range(len(below))] == below
+        below = [bool(word) for word in level]
+
+def test_journaled_tracker():
+    def state(tracker):
+        return {name: sorted(pool.allocated) for name, pool in tracker.servers.items() if len(pool)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hosts")
+        rng = random.Random(2)
+        reference = ServerTracker()
+        live = []
+        with JournaledServerTracker(path, snapshot_every=50) as tracker:
+            for _ in range(400):
+                if live and rng.random() < 0.4:
+                    name = live.pop(rng.randrange(len(live)))
+                    tracker.deallocate(name)
+                    reference.deallocate(name)
+                else:
+                    name = rng.choice(["apibox", "sitebox"])
+                    hostname = tracker.allocate(name)
+                    assert hostname == reference.allocate(name)
+                    live.append(hostname)
+            tracker.deallocate_many(live[:5])
+            reference.deallocate_many(live[:5])
+            expected = state(reference)
+
+        with JournaledServerTracker(path, snapshot_every=50) as tracker:
+            assert state(tracker) == expected
+            assert tracker.allocate("apibox") == reference.allocate("apibox")
+
+        # crash after the snapshot was replaced but before the journal was reset
+        with JournaledServerTracker(path, snapshot_every=10**9) as tracker:
+            tracker.allocate_many("sitebox", 3)
+            shutil.copy(tracker.journal_path, path + ".old")
+            tracker.snapshot()
+            expected = state(tracker)
+        shutil.copy(path + ".old", path + ".journal")
+        # and a torn write at the end of the journal
+        with open(path + ".journal", "a") as f:
+            f.write("999 A apib")
+        with JournaledServerTracker(path) as tracker:
+            assert state(tracker) == expected
+            tracker.allocate("apibox")
+        with JournaledServerTracker(path, pool_factory=BitmapNumberPool) as tracker:
+            assert len(tracker.servers["apibox"]) == len(expected["apibox"]) + 1
 
 
-test_next_server_number()
-test_server_tracker()
\ No newline at end of file
+if __name__ == "__main__":
+    test_split_hostname()
+    test_next_server_number()
+    test_server_tracker()
+    test_number_pool()
+    test_bulk_allocate()
+    test_concurrent_tracker()
+    test_bitmap_pool()
+    test_journaled_tracker()
+    # bench_contention()
\ No newline at end of file